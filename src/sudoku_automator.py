@@ -1,21 +1,81 @@
-from ppadb.client import Client
-from ppadb.device import Device
 from PIL import Image
 import pathlib
 import io
 import datetime
-from sudoku_solver import SudokuSolver
+from sudoku_solver import BOX_OF, COL_OF, ROW_OF, SudokuSolver, METHODS
+from sudoku_calibration import calibrate
+from sudoku_profiles import BoardProfileStore, write_json
+from sudoku_instrumentation import Instrumentation, JsonLinesSink
+from sudoku_input import INPUT_MODES, DryRunInjector, TapInjector, create_injector, plan_taps
+from sudoku_recognition import (
+    BINARIZATIONS, CACHE_MODES, RECOGNIZERS, IncrementalBoardReader, ParallelRecognizer, RecognitionCache,
+    TemplateBank, TemplateMatcher, board_threshold, digit_scores, empty_mask, recognize_with, score_margins, ssim_digit
+)
+from sudoku_lazy import lazy_import
 import time
-import readline
-import copy
+import itertools
 import json
-import cv2
 import numpy as np
-from sklearn.cluster import KMeans
-from skimage.metrics import structural_similarity as ssim
-import warnings
 import argparse
-warnings.filterwarnings('ignore', message='Number of distinct clusters*')
+import struct
+import threading
+
+# Loaded by the stage that needs them, so startup and code paths that never
+# reach them stay fast
+Client = lazy_import("ppadb.client", "Client")
+Device = lazy_import("ppadb.device", "Device")
+futures = lazy_import("concurrent.futures")
+
+CAPTURE_MODES: tuple[str, ...] = ("png", "raw")
+CALIBRATION_MODES: tuple[str, ...] = ("auto", "interactive")
+
+# Squares recognized between two attempts to find forced answers when streaming
+STREAM_BATCH_SIZE = 9
+
+# A board without solutions is repaired by giving up to REPAIR_MAX_CHANGES of
+# its REPAIR_SUSPECTS least confident givens their second best digit
+REPAIR_SUSPECTS = 8
+REPAIR_MAX_CHANGES = 2
+
+# Android PixelFormat values screencap can report, and their bytes per pixel
+RAW_PIXEL_FORMATS: dict[int, int] = {
+    1: 4,  # RGBA_8888
+    2: 4,  # RGBX_8888
+    5: 4,  # BGRA_8888
+}
+
+
+def parse_raw_screencap(data: bytes | bytearray) -> tuple[np.ndarray, int]:
+    """Wraps the output of "screencap" without "-p" as a pixel array. The
+    array shares memory with data, nothing is copied except for BGRA screens
+    which need their channels swapped
+
+    Args:
+        data (bytes | bytearray): Raw screencap output, a 12 or 16 byte header
+        (width, height, format and on newer Androids the colour space)
+        followed by the pixels
+
+    Returns:
+        tuple[np.ndarray, int]: RGBA pixels with shape (height, width, 4)
+        and the size of the header in bytes
+    """
+    if len(data) < 12:
+        raise RuntimeError("Screencap returned no data!")
+
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    if pixel_format not in RAW_PIXEL_FORMATS:
+        raise RuntimeError(f"Unsupported screencap pixel format: {pixel_format}")
+
+    pixel_count = width * height * RAW_PIXEL_FORMATS[pixel_format]
+    header_size = len(data) - pixel_count
+    if header_size not in (12, 16):
+        raise RuntimeError("Screencap returned an unexpected amount of data!")
+
+    pixels = np.frombuffer(data, dtype=np.uint8, count=pixel_count, offset=header_size)
+    pixels = pixels.reshape(height, width, 4)
+    if pixel_format == 5:
+        pixels = pixels[..., [2, 1, 0, 3]]
+    return pixels, header_size
 
 
 def time_function(func, t0: float, message_before: str, message_after: str, *args: tuple) -> tuple:
@@ -33,21 +93,111 @@ def time_function(func, t0: float, message_before: str, message_after: str, *arg
     """
 
     print(message_before)
-    start_time: float = time.time()
+    start_time: float = time.perf_counter()
     result = func(*args)
-    end_time: float = time.time()
+    end_time: float = time.perf_counter()
     delta_time: float = end_time - start_time
     print(f"{message_after} Total time: {round(t0 + delta_time, 2)} seconds.")
     return t0 + delta_time, result
 
 
+class LoopStats:
+    """Summary statistics of a run_loop session"""
+
+    def __init__(self) -> None:
+        self.boards: int = 0
+        self.frames: int = 0
+        self.reclassified: int = 0
+        self.failures: int = 0
+        self.taps: int = 0
+        self.seconds: float = 0.0
+        self.stage_seconds: dict[str, float] = {"capture": 0.0, "recognize": 0.0, "solve": 0.0, "input": 0.0}
+
+    def summary(self) -> str:
+        """Formats the statistics for printing
+
+        Returns:
+            str: Multi-line summary
+        """
+        lines = [
+            f"Solved {self.boards} board(s) in {round(self.seconds, 2)} seconds "
+            f"({round(self.boards / self.seconds * 60 if self.seconds else 0.0, 2)} boards per minute).",
+            f"Read {self.frames} frame(s), {self.failures} board(s) could not be solved, sent {self.taps} taps.",
+            f"Classified {self.reclassified} of {self.frames * 81} squares, the rest were unchanged between frames.",
+        ]
+        for stage, seconds in self.stage_seconds.items():
+            count = self.boards if stage in ("solve", "input") else self.frames
+            average = seconds / count * 1000 if count else 0.0
+            lines.append(f"{stage.capitalize()}: {round(seconds, 2)} seconds in total, {round(average, 1)} ms on average.")
+        return "\n".join(lines)
+
+
 class SudokuAutomator:
-    def __init__(self, debug=False, board_data_filename="board_data.json") -> None:
+    board_data_lock: threading.Lock = threading.Lock()
+
+    def __init__(
+        self,
+        debug=False,
+        board_data_filename="board_data.json",
+        solver_method="bitmask",
+        max_solutions=10,
+        binarization="otsu",
+        recognizer="ncc",
+        capture="png",
+        input_mode="tap",
+        tap_delay=0.0,
+        dry_run=False,
+        screenshot_path=None,
+        serial=None,
+        interactive=True,
+        cache_mode="exact",
+        persist_cache=False,
+        reread_tolerance=0.0,
+        calibration="auto",
+        profiles_filename=None,
+        instrumentation=None,
+        recognition_workers=1,
+        stream=False
+    ) -> None:
         self.debug: bool = debug
         self.device: Device = None
         self.total_debug_path: str = ""
         self.number_squares: list[np.ndarray] = []
         self.board_data_filename: str = board_data_filename
+        self.solver_method: str = solver_method
+        # Two solutions are needed to tell that a board is not unique
+        self.max_solutions: int = max(2, max_solutions)
+        self.binarization: str = binarization
+        self.threshold: float | None = None
+        self.recognizer: str = recognizer
+        self.template_bank: TemplateBank = None
+        self.recognition_workers: int = recognition_workers
+        self.parallel_recognizer: ParallelRecognizer = None
+        self.stream: bool = stream
+        self.capture: str = capture
+        self.raw_layout: tuple[int, int, int] = None
+        self.input_mode: str = input_mode
+        self.tap_delay: float = tap_delay
+        self.injector: TapInjector = None
+        self.taps_per_second: float = 0.0
+        self.dry_run: bool = dry_run
+        self.screenshot_path: str = screenshot_path
+        self.serial: str = serial
+        self.interactive: bool = interactive
+        self.board_data: dict[str, int] = None
+        self.calibration: str = calibration
+        self.profile_store: BoardProfileStore = None
+        if profiles_filename is not None:
+            self.profile_store = BoardProfileStore.open(profiles_filename)
+        self.device_model: str = None
+        self.persist_cache: bool = persist_cache
+        self.recognition_cache: RecognitionCache = None
+        if cache_mode != "off":
+            self.recognition_cache = RecognitionCache(cache_mode)
+            if persist_cache:
+                self.recognition_cache.load(self.cache_filename())
+        self.board_reader: IncrementalBoardReader = IncrementalBoardReader(self.recognize_squares, reread_tolerance)
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
 
         self.createDebugFolders()
         self.load_number_squares()
@@ -67,47 +217,119 @@ class SudokuAutomator:
         pathlib.Path(self.total_debug_path).mkdir(exist_ok=True, parents=True)
 
     def load_number_squares(self) -> None:
-        """Loads the number squares from the folder number_squares"""
+        """Loads the number squares from the folder number_squares next to
+        this script. They are read once per process and shared by every automator"""
 
-        self.number_squares: list[np.ndarray] = []
-        for i in range(1, 10):
-            img = cv2.imread(f"./number_squares/{i}.png")
-            self.number_squares.append(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+        self.template_bank = TemplateBank.load()
+        self.number_squares: list[np.ndarray] = list(self.template_bank.images)
+
+    def matcher_for(self, height: int, width: int) -> TemplateMatcher:
+        """Gets the template matcher for squares of the given size. The
+        templates are scaled once per size and process, so squares never have
+        to be resized
+
+        Args:
+            height (int): Square height in pixels
+            width (int): Square width in pixels
+
+        Returns:
+            TemplateMatcher: Matcher with templates of the given size
+        """
+        return self.template_bank.matcher_for(height, width)
+
+    def cache_filename(self) -> str:
+        """The file the recognition cache is stored in, next to the board data file
+
+        Returns:
+            str: Cache filename
+        """
+        return str(pathlib.Path(self.board_data_filename).with_suffix(".cache.json"))
+
+    def report_cache(self) -> None:
+        """Prints the recognition cache hit and miss counts, and saves the
+        cache if it is persistent"""
+
+        if self.recognition_cache is None:
+            return
+        print(f"Recognition cache: {self.recognition_cache.hits} hits, {self.recognition_cache.misses} misses.")
+        if self.persist_cache:
+            self.recognition_cache.save(self.cache_filename())
 
     def connectToPhone(self) -> None:
-        """Connects to your phone via adb"""
+        """Connects to your phone via adb. If more than one phone is
+        attached, the serial number given to the automator picks one"""
 
         adb = Client(host="127.0.0.1", port=5037)
         devices: list[Device] = adb.devices()
 
         if len(devices) == 0:
             raise RuntimeError("No devices found!")
-        elif len(devices) == 1:
-            self.device = devices[0]
-            return
 
-        for i, device in enumerate(devices):
-            print(f"[{i}] {device.get_serial_no()}")
+        if self.serial is not None:
+            for device in devices:
+                if device.serial == self.serial:
+                    self.device = device
+                    return
+            raise RuntimeError(f"Device {self.serial} not found!")
 
-        while True:
-            deviceIndex = int(input("Please choose your device: "))
-            if deviceIndex >= len(devices) or deviceIndex < 0:
-                print("Please enter a valid index!")
-            else:
-                self.device = devices[deviceIndex]
-                break
+        if len(devices) > 1:
+            serials = ", ".join(device.serial for device in devices)
+            raise RuntimeError(f"Found several devices, please choose one with --serial: {serials}")
+        self.device = devices[0]
+
+    def get_device_model(self) -> str:
+        """Reads the model name of the connected phone once
+
+        Returns:
+            str: Device model, "unknown" without a phone
+        """
+        if self.device_model is None:
+            model = self.device.shell("getprop ro.product.model").strip() if self.device else ""
+            self.device_model = model or "unknown"
+        return self.device_model
+
+    def execOut(self, command: str) -> bytearray:
+        """Runs a command on your phone and returns its raw output. Unlike
+        device.shell, the output is binary safe and is not decoded
+
+        Args:
+            command (str): Command to run
+
+        Returns:
+            bytearray: Everything the command wrote to stdout
+        """
+
+        if not self.device:
+            raise RuntimeError("Error: Please connect to your phone via ADB")
 
-    def takeScreenshot(self) -> Image.Image:
+        connection = self.device.create_connection()
+        with connection:
+            connection.send(f"exec:{command}")
+            return connection.read_all()
+
+    def takeScreenshot(self) -> Image.Image | np.ndarray:
         """Takes a screenshot from your phone, converts it to PIL Image
-        then returns it
+        then returns it. In raw capture mode the phone skips PNG encoding and
+        the pixels are returned as an RGBA array instead. If a screenshot
+        file was given, that file is read instead
 
         Returns:
-            Image.Image: Screenshot of your phone
+            Image.Image | np.ndarray: Screenshot of your phone
         """
 
+        if self.screenshot_path:
+            return Image.open(self.screenshot_path).convert("RGBA")
+
         if not self.device:
             raise RuntimeError("Error: Please connect to your phone via ADB")
 
+        if self.capture == "raw":
+            image, header_size = parse_raw_screencap(self.execOut("screencap"))
+            self.raw_layout = (header_size, image.shape[1], image.shape[0])
+            if self.debug:
+                Image.fromarray(image).save(f"{self.total_debug_path}/screenshot.png")
+            return image
+
         image = self.device.screencap()
         image: Image = Image.open(io.BytesIO(image))
         if self.debug:
@@ -115,21 +337,115 @@ class SudokuAutomator:
 
         return image
 
-    def analyze_board(self, screenshot: Image.Image) -> dict[str, int]:
-        """Gathers the board info, it asks some question to user if the board data file
-        is not present. If the file is present, it just reads the file and returns
-        the data it got.
+    def takeBoardScreenshot(self, board_data: dict[str, int]) -> np.ndarray:
+        """Captures only the board in raw mode. The phone still renders the
+        whole screen, but only the rows the board covers are sent over ADB.
+        The result is relative to the top left square, so pass
+        board_region_data(board_data) to the functions that read it
+
+        Args:
+            board_data (dict[str, int]): Board data dictionary
+
+        Returns:
+            np.ndarray: RGBA pixels of the board
+        """
+
+        if self.raw_layout is None:
+            # The header size and screen width are needed to find the board rows
+            pixels = self.takeScreenshot()
+            if isinstance(pixels, Image.Image):
+                pixels = np.asarray(pixels.convert("RGBA"))
+            x, y = board_data["square_x"], board_data["square_y"]
+            return pixels[y:y + board_data["board_height"], x:x + board_data["board_width"]]
+
+        header_size, width, _ = self.raw_layout
+        row_size = width * 4
+        start = header_size + board_data["square_y"] * row_size
+        length = board_data["board_height"] * row_size
+
+        data = self.execOut(f"screencap | tail -c +{start + 1} | head -c {length}")
+        if len(data) != length:
+            raise RuntimeError("Screencap returned an unexpected amount of data!")
+
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(board_data["board_height"], width, 4)
+        return pixels[:, board_data["square_x"]:board_data["square_x"] + board_data["board_width"]]
+
+    def board_region_data(self, board_data: dict[str, int]) -> dict[str, int]:
+        """Board data for images that only contain the board, as returned
+        by takeBoardScreenshot
+
+        Args:
+            board_data (dict[str, int]): Board data dictionary
+
+        Returns:
+            dict[str, int]: Copy of the board data with the first square at 0, 0
+        """
+        return dict(board_data, square_x=0, square_y=0)
+
+    def analyze_board(self, screenshot: Image.Image | np.ndarray) -> dict[str, int]:
+        """Gathers the board info. With a profile file, the profile of the
+        phone model and screen resolution is used. Otherwise the board data
+        file is read if it is present. If neither has the board, it is
+        measured on the screenshot and saved for the next runs. The number
+        templates are scaled to the square size right away.
+
+        Args:
+            screenshot (Image.Image | np.ndarray): Screenshot of the phone with the board visible.
+
+        Returns:
+            dict[str, int]: The board data as dictionary.
+        """
+
+        if self.profile_store is not None:
+            height, width = np.asarray(screenshot).shape[:2]
+            model = self.get_device_model()
+            board_data = self.profile_store.lookup(model, width, height)
+            if board_data is None:
+                board_data = self.measure_board(screenshot)
+                self.profile_store.save_profile(model, width, height, board_data)
+        else:
+            # Automators on other threads may share the file, only one measures and writes it
+            with self.board_data_lock:
+                if pathlib.Path(self.board_data_filename).exists():
+                    with open(self.board_data_filename, "r") as file:
+                        board_data = json.load(file)
+                else:
+                    board_data = self.measure_board(screenshot)
+                    write_json(self.board_data_filename, board_data)
+
+        # Scale the templates for this board once and keep them for the next start
+        self.matcher_for(board_data["square_height"], board_data["square_width"])
+        self.template_bank.persist()
+        return board_data
+
+    def measure_board(self, screenshot: Image.Image | np.ndarray) -> dict[str, int]:
+        """Measures the board on the screenshot automatically, or by asking
+        the user some questions if that fails or interactive calibration was
+        chosen.
 
         Args:
-            screenshot (Image.Image): Screenshot of the phone with the board visible.
+            screenshot (Image.Image | np.ndarray): Screenshot of the phone with the board visible.
 
         Returns:
             dict[str, int]: The board data as dictionary.
         """
 
-        # Reads the top left coordinate of the board. It asks the user for once. Reads board info,
-        # then saves it to a file called "board_data.json". As long as that file exists,
-        # it reads from there in the future.
+        if self.calibration == "auto":
+            try:
+                board_data = calibrate(np.asarray(screenshot))
+            except RuntimeError as re:
+                if not self.interactive:
+                    raise
+                print(f"Automatic calibration failed: {re}")
+            else:
+                board_data["input_strategy"] = "cell_first"
+                return board_data
+
+        if not self.interactive:
+            raise RuntimeError("No board data found for this phone!")
+
+        # Reads the top left coordinate of the board. It asks the user for once and
+        # gathers the rest of the board info from the screenshot.
         board_width, board_height = 0, 0
         square_x, square_y = 0, 0
         square_width, square_height = 0, 0
@@ -138,104 +454,100 @@ class SudokuAutomator:
         answer_x, answer_y = 0, 0
         answer_distance = 0
 
-        board_data = dict()
+        import readline  # noqa: F401, line editing for the prompts below
 
-        if (pathlib.Path(self.board_data_filename).exists()):
-            with open(self.board_data_filename, "r") as file:
-                board_data = json.load(file)
-        else:
-            while True:
-                xy_coords: str = input("Please enter the top left coordinates of the first square seperated by a comma: ")
-                try:
-                    x_str, y_str = xy_coords.split(',')
-                    square_x, square_y = int(x_str), int(y_str)
-                    if square_x < 0 or square_y < 0 or square_x > screenshot.size[0] or square_y > screenshot.size[1]:
-                        raise Exception()
-                except Exception:
-                    print("Please enter a valid coordinate!")
-                else:
-                    break
-            pathlib.Path(self.board_data_filename).touch()
+        if isinstance(screenshot, np.ndarray):
+            screenshot = Image.fromarray(screenshot)
+        while True:
+            xy_coords: str = input("Please enter the top left coordinates of the first square seperated by a comma: ")
+            try:
+                x_str, y_str = xy_coords.split(',')
+                square_x, square_y = int(x_str), int(y_str)
+                if square_x < 0 or square_y < 0 or square_x > screenshot.size[0] or square_y > screenshot.size[1]:
+                    raise Exception()
+            except Exception:
+                print("Please enter a valid coordinate!")
+            else:
+                break
 
-            def is_close_color(c1: tuple, c2: tuple, tol: float) -> bool:
-                square_sum = 0
-                for a, b in zip(c1, c2):
-                    square_sum += (a - b) ** 2
-                return (square_sum**.5) <= tol
+        def is_close_color(c1: tuple, c2: tuple, tol: float) -> bool:
+            square_sum = 0
+            for a, b in zip(c1, c2):
+                square_sum += (a - b) ** 2
+            return (square_sum**.5) <= tol
 
-            def get_size_of_area(img: Image.Image, x: int, y: int, height: bool = False) -> int:
-                size = 0
-                color = img.getpixel((x, y))
+        def get_size_of_area(img: Image.Image, x: int, y: int, height: bool = False) -> int:
+            size = 0
+            color = img.getpixel((x, y))
 
-                while is_close_color(img.getpixel((x + size * int(not height), y + size * int(height))), color, 5):
-                    size += 1
-                return size
+            while is_close_color(img.getpixel((x + size * int(not height), y + size * int(height))), color, 5):
+                size += 1
+            return size
 
-            # Get square dimensions
-            square_width = get_size_of_area(screenshot, square_x, square_y, False)
-            square_height = get_size_of_area(screenshot, square_x, square_y, True)
+        # Get square dimensions
+        square_width = get_size_of_area(screenshot, square_x, square_y, False)
+        square_height = get_size_of_area(screenshot, square_x, square_y, True)
 
-            # Get the sizes of horizontal and vertical haps
-            start_x_original = square_x + square_width
-            start_y_original = square_y + square_height
+        # Get the sizes of horizontal and vertical haps
+        start_x_original = square_x + square_width
+        start_y_original = square_y + square_height
 
-            start_x = start_x_original
-            while len(horizontal_gaps) < 8:
-                size = get_size_of_area(screenshot, start_x, square_y)
-                start_x += size + square_width
-                horizontal_gaps.append(size)
+        start_x = start_x_original
+        while len(horizontal_gaps) < 8:
+            size = get_size_of_area(screenshot, start_x, square_y)
+            start_x += size + square_width
+            horizontal_gaps.append(size)
 
-            start_y = start_y_original
-            while len(vertical_gaps) < 8:
-                size = get_size_of_area(screenshot, square_x, start_y, True)
-                start_y += size + square_height
-                vertical_gaps.append(size)
+        start_y = start_y_original
+        while len(vertical_gaps) < 8:
+            size = get_size_of_area(screenshot, square_x, start_y, True)
+            start_y += size + square_height
+            vertical_gaps.append(size)
 
-            board_width = 9 * square_width + sum(horizontal_gaps)
-            board_height = 9 * square_height + sum(vertical_gaps)
+        board_width = 9 * square_width + sum(horizontal_gaps)
+        board_height = 9 * square_height + sum(vertical_gaps)
 
-            while True:
-                answer_xy: str = input("Please enter the center position of the first answer button, seperated by comma: ")
-                try:
-                    answer_xstr, answer_ystr = answer_xy.split(',')
-                    answer_x, answer_y = int(answer_xstr), int(answer_ystr)
-                except Exception:
-                    print("Please enter a valid input!")
-                else:
-                    break
+        while True:
+            answer_xy: str = input("Please enter the center position of the first answer button, seperated by comma: ")
+            try:
+                answer_xstr, answer_ystr = answer_xy.split(',')
+                answer_x, answer_y = int(answer_xstr), int(answer_ystr)
+            except Exception:
+                print("Please enter a valid input!")
+            else:
+                break
 
-            while True:
-                answer_dist_str = input("Please enter the distance between two answer buttons: ")
-                try:
-                    answer_distance = int(answer_dist_str)
-                except Exception:
-                    print("Please enter a valid input!")
-                else:
-                    break
+        while True:
+            answer_dist_str = input("Please enter the distance between two answer buttons: ")
+            try:
+                answer_distance = int(answer_dist_str)
+            except Exception:
+                print("Please enter a valid input!")
+            else:
+                break
 
-            board_data = {
-                "board_width": board_width,
-                "board_height": board_height,
-                "square_x": square_x,
-                "square_y": square_y,
-                "square_width": square_width,
-                "square_height": square_height,
-                "horizontal_gaps": horizontal_gaps,
-                "vertical_gaps": vertical_gaps,
-                "answer_x": answer_x,
-                "answer_y": answer_y,
-                "answer_distance": answer_distance,
-            }
-            with open(self.board_data_filename, "w") as file:
-                json.dump(board_data, file)
+        board_data = {
+            "board_width": board_width,
+            "board_height": board_height,
+            "square_x": square_x,
+            "square_y": square_y,
+            "square_width": square_width,
+            "square_height": square_height,
+            "horizontal_gaps": horizontal_gaps,
+            "vertical_gaps": vertical_gaps,
+            "answer_x": answer_x,
+            "answer_y": answer_y,
+            "answer_distance": answer_distance,
+            "input_strategy": "cell_first",
+        }
 
         return board_data
 
-    def crop_image(self, img: Image.Image, x: int, y: int, width: int, height: int) -> Image.Image:
+    def crop_image(self, img: Image.Image | np.ndarray, x: int, y: int, width: int, height: int) -> Image.Image:
         """Crops the given image by the given coordinate and size
 
         Args:
-            img (Image.Image): Image to crop
+            img (Image.Image | np.ndarray): Image to crop
             x (int): X coordinate of the top left pixel of the new image
             y (int): Y coordinate of the top left pixel of the new image
             width (int): Width of the new image
@@ -244,57 +556,78 @@ class SudokuAutomator:
         Returns:
             Image.Image: Cropped image
         """
+        if isinstance(img, np.ndarray):
+            return Image.fromarray(img[y:y + height, x:x + width])
         return img.crop((x, y, x + width, y + height))
 
-    def get_square_coords(self, board_data: dict[str, int], x_board: int, y_board: int) -> tuple:
-        """Get the top left coordinates of specified square on the screenshot
+    def compute_threshold(self, screenshot: Image.Image | np.ndarray, board_data: dict[str, int]) -> float:
+        """Computes the gray level that separates digits from the background
+        once for the whole board, used by the "threshold" binarization
+
+        Args:
+            screenshot (Image.Image | np.ndarray): Screenshot of the game
+            board_data (dict[str, int]): Board data dictionary
+
+        Returns:
+            float: Threshold gray level
+        """
+        x, y = board_data["square_x"], board_data["square_y"]
+        board = np.asarray(screenshot)[y:y + board_data["board_height"], x:x + board_data["board_width"], :3]
+        return board_threshold(board)
+
+    def get_square_offsets(self, board_data: dict[str, int]) -> tuple[list[int], list[int]]:
+        """Get the left coordinates of all columns and the top coordinates of
+        all rows of squares on the screenshot
 
         Args:
             board_data (dict[str, int]): Board data dictionary
-            x_board (int): Horizontal index of the square
-            y_board (int): Vertical index of the square
 
         Returns:
-            tuple: x,y coordinate of the given square
+            tuple[list[int], list[int]]: x coordinates of the 9 columns and
+            y coordinates of the 9 rows
         """
         square_x = board_data["square_x"]
         square_y = board_data["square_y"]
         square_width = board_data["square_width"]
         square_height = board_data["square_height"]
-        horizontal_gaps = board_data["horizontal_gaps"]
-        vertical_gaps = board_data["vertical_gaps"]
+        horizontal_gaps = itertools.accumulate(board_data["horizontal_gaps"][:8], initial=0)
+        vertical_gaps = itertools.accumulate(board_data["vertical_gaps"][:8], initial=0)
 
         return (
-            square_x + (x_board) * square_width + sum(horizontal_gaps[:x_board]),
-            square_y + (y_board) * square_height + sum(vertical_gaps[:y_board]),
-                )
+            [square_x + i * square_width + gap for i, gap in enumerate(horizontal_gaps)],
+            [square_y + i * square_height + gap for i, gap in enumerate(vertical_gaps)],
+        )
 
-    def get_square_images(self, screenshot: Image.Image, board_data: dict[str, int]) -> list[Image.Image]:
-        """Get all square images that are on the board
+    def get_square_images(self, screenshot: Image.Image | np.ndarray, board_data: dict[str, int]) -> list[np.ndarray]:
+        """Get all square images that are on the board. The screenshot is
+        converted to an array once and the squares are views into it, so
+        nothing is copied
 
         Args:
-            screenshot (Image.Image): Screenshot of the game
+            screenshot (Image.Image | np.ndarray): Screenshot of the game
             board_data (dict[str, int]): Board data dictionary
 
         Returns:
-            list[Image.Image]: All 81 squares in a list
+            list[np.ndarray]: All 81 squares in a list, in row-major order
         """
 
         square_width = board_data["square_width"]
         square_height = board_data["square_height"]
+        columns, rows = self.get_square_offsets(board_data)
+        pixels = np.asarray(screenshot)
 
-        squares: list[Image.Image] = []
-        for y in range(0, 9):
-            for x in range(0, 9):
-                current_x, current_y = self.get_square_coords(board_data, x, y)
-                square = screenshot.crop((current_x, current_y, current_x + square_width, current_y + square_height))
-                squares.append(square)
+        squares: list[np.ndarray] = [
+            pixels[current_y:current_y + square_height, current_x:current_x + square_width]
+            for current_y in rows
+            for current_x in columns
+        ]
 
-                if self.debug:
-                    pathlib.Path(f"{self.total_debug_path}/squares/").mkdir(exist_ok=True, parents=True)
-                    square.save(f"{self.total_debug_path}/squares/square_{y}_{x}.png")
+        if self.debug:
+            pathlib.Path(f"{self.total_debug_path}/squares/").mkdir(exist_ok=True, parents=True)
+            for i, square in enumerate(squares):
+                Image.fromarray(square).save(f"{self.total_debug_path}/squares/square_{i // 9}_{i % 9}.png")
 
-        return copy.deepcopy(squares)
+        return squares
 
     def get_empty_squares(self, board: list[list[int]]) -> list[tuple[int, int]]:
         """Get a list of indexes of empty squares on the given board
@@ -313,85 +646,243 @@ class SudokuAutomator:
 
         return indexes
 
-    def square_to_int(self, square_img: Image.Image) -> int:
+    def square_to_int(self, square_img: Image.Image | np.ndarray) -> int:
         """Extract the number from given square image.
 
         Args:
-            square_img (Image.Image): Image to process
+            square_img (Image.Image | np.ndarray): Image to process
 
         Returns:
             int: The number on the square
         """
-        primary_color = (255, 255, 255, 255)
-        secondary_color = (0, 0, 0, 255)
+        return ssim_digit(square_img, self.template_bank, self.binarization, self.threshold)
 
-        opencv_image = np.array(square_img)
-        reshaped_image = cv2.cvtColor(opencv_image, cv2.COLOR_RGBA2RGB).reshape(-1, 3)
+    def squares_to_board(self, squares: list[np.ndarray]) -> list[list[int]]:
+        """Convert the given list of square images to a sudoku board
 
-        if (reshaped_image == reshaped_image[0]).all() == 1:
-            return 0
+        Args:
+            squares (list[np.ndarray]): List of square images
 
-        kmeans = KMeans(n_clusters=2, n_init='auto')
-        kmeans.fit(reshaped_image)
+        Returns:
+            list[list[int]]: Board
+        """
 
-        primary_number = 0
-        labels = kmeans.labels_
-        unique_labels, counts = np.unique(labels, return_counts=True)
+        digits = self.recognize_squares(squares)
+        return [digits[y * 9:y * 9 + 9] for y in range(0, 9)]
 
-        if counts[0] > counts[1]:
-            primary_number = unique_labels[0]
-        else:
-            primary_number = unique_labels[1]
+    def recognize_squares(self, squares: list[np.ndarray]) -> list[int]:
+        """Recognizes square images, skipping the ones the recognition
+        cache already knows
 
-        labels = labels.reshape(opencv_image.shape[0], opencv_image.shape[1])
-        for y in range(opencv_image.shape[0]):
-            for x in range(opencv_image.shape[1]):
-                if labels[y, x] == primary_number:
-                    opencv_image[y, x] = primary_color
-                else:
-                    opencv_image[y, x] = secondary_color
+        Args:
+            squares (list[np.ndarray]): List of square images
 
-        gray_img = cv2.cvtColor(opencv_image, cv2.COLOR_RGB2GRAY)
-        if gray_img.shape != self.number_squares[0].shape:
-            gray_img = cv2.resize(gray_img, self.number_squares[0].shape)
+        Returns:
+            list[int]: The number on each square
+        """
 
-        ssim_list: list[int] = []
-        for i in range(0, 9):
-            result = ssim(gray_img, self.number_squares[i])
-            ssim_list.append(result)
+        self.instrumentation.count("recognition.squares", len(squares))
+        cache = self.recognition_cache
+        if cache is None:
+            return self.classify_squares(squares)
 
-        return ssim_list.index(max(ssim_list)) + 1
+        # The keys already hold the square size, the tag everything else the digit depends on
+        cache.tag = f"{self.recognizer}/{self.binarization}/{self.threshold}/{self.template_bank.fingerprint}/"
+        keys = [cache.key(square) for square in squares]
 
-    def squares_to_board(self, squares: list[Image.Image]) -> list[list[int]]:
-        """Convert the given list of square images to a sudoku board
+        # Squares that look the same within this board are looked up and classified once
+        first: dict[str, int] = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+        cache.hits += len(keys) - len(first)
+        digits = {key: cache.get(key) for key in first}
+        misses = [key for key, digit in digits.items() if digit is None]
+
+        self.instrumentation.count("recognition.cache_hits", len(keys) - len(misses))
+        self.instrumentation.count("recognition.cache_misses", len(misses))
+
+        for key, digit in zip(misses, self.classify_squares([squares[first[key]] for key in misses])):
+            cache.put(key, digit)
+            digits[key] = digit
+        return [digits[key] for key in keys]
+
+    def classify_squares(self, squares: list[np.ndarray]) -> list[int]:
+        """Recognizes square images with the selected recognizer, on a
+        process pool if more than one recognition worker was chosen
 
         Args:
-            squares (list[Image.Image]): List of square images
+            squares (list[np.ndarray]): List of square images
 
         Returns:
-            list[list[int]]: Board
+            list[int]: The number on each square
         """
 
-        board: list[list[int]] = []
-        for y in range(0, 9):
-            line: list[int] = []
-            for x in range(0, 9):
-                line.append(self.square_to_int(squares[y * 9 + x]))
-            board.append(copy.deepcopy(line))
-        return board
+        if not squares:
+            return []
+        self.instrumentation.count("recognition.classified", len(squares))
+        if self.recognition_workers > 1:
+            if self.parallel_recognizer is None:
+                self.parallel_recognizer = ParallelRecognizer(self.recognition_workers)
+            return self.parallel_recognizer.recognize_cells(squares, self.recognizer, self.binarization, self.threshold)
+        return recognize_with(self.template_bank, squares, self.recognizer, self.binarization, self.threshold)
+
+    def stream_board(
+        self,
+        squares: list[np.ndarray],
+        board_data: dict[str, int]
+    ) -> tuple[list[list[int]], dict[tuple[int, int], int]]:
+        """Converts the square images to a board like squares_to_board, but
+        sends answers while it is still reading. Empty squares are found
+        first, which is cheap, and the givens are then recognized in batches,
+        those in the fullest rows, columns and boxes first. After every batch
+        the givens read so far are propagated with SudokuSolver.propagate and
+        the empty squares they force are tapped on a background thread
+
+        Args:
+            squares (list[np.ndarray]): List of square images
+            board_data (dict[str, int]): Board data dictionary
+
+        Returns:
+            tuple[list[list[int]], dict[tuple[int, int], int]]: Board, and the
+            answers that were already sent by square index
+        """
+        start_time = time.perf_counter()
+        empty = empty_mask(np.stack([np.asarray(square)[..., :3] for square in squares])).tolist()
+        self.instrumentation.count("recognition.squares", sum(empty))
+
+        # Fuller units are completed by fewer givens and then force their last squares
+        filled = [i for i in range(81) if not empty[i]]
+        unit_counts = [0] * 27
+        for i in filled:
+            unit_counts[ROW_OF[i]] += 1
+            unit_counts[9 + COL_OF[i]] += 1
+            unit_counts[18 + BOX_OF[i]] += 1
+        filled.sort(key=lambda i: -(unit_counts[ROW_OF[i]] + unit_counts[9 + COL_OF[i]] + unit_counts[18 + BOX_OF[i]]))
+
+        board = [[0] * 9 for _ in range(9)]
+        partial: list[list[int]] | None = [[0] * 9 for _ in range(9)]
+        tapped: dict[tuple[int, int], int] = {}
+        pending: list[futures.Future] = []
+        solver_stats: dict[str, int] = {}
+
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            for start in range(0, len(filled), STREAM_BATCH_SIZE):
+                batch = filled[start:start + STREAM_BATCH_SIZE]
+                for i, digit in zip(batch, self.recognize_squares([squares[i] for i in batch])):
+                    board[ROW_OF[i]][COL_OF[i]] = digit
+                    if partial is not None:
+                        partial[ROW_OF[i]][COL_OF[i]] = digit
+
+                # After a contradiction only the full board is solved and checked
+                if partial is None or start + STREAM_BATCH_SIZE >= len(filled):
+                    continue
+                partial = SudokuSolver.propagate(partial, solver_stats)
+                if partial is None:
+                    continue
+
+                forced = [
+                    (COL_OF[i], ROW_OF[i]) for i in range(81)
+                    if empty[i] and partial[ROW_OF[i]][COL_OF[i]] and (COL_OF[i], ROW_OF[i]) not in tapped
+                ]
+                if not forced:
+                    continue
+                if not tapped:
+                    print(f"Sending the first answers after {round(time.perf_counter() - start_time, 3)} seconds.")
+                tapped.update({(x, y): partial[y][x] for x, y in forced})
+                # The next batches write into partial, the taps get their own copy
+                answers = [list(row) for row in partial]
+                pending.append(executor.submit(self.solve_on_screen, forced, answers, board_data))
+        except BaseException:
+            # Taps that did not start are dropped, and errors of the others would hide this one
+            executor.shutdown(cancel_futures=True)
+            raise
+        executor.shutdown()
+        for future in pending:
+            future.result()
+
+        self.instrumentation.count_all(solver_stats, "solver.")
+        self.instrumentation.count("stream.early_answers", len(tapped))
+        return board, tapped
+
+    def repair_board(self, board: list[list[int]], squares: list[np.ndarray]) -> list[list[int]] | None:
+        """Looks for misread squares on a board without a solution. The
+        givens are scored again to get the margin between their best and
+        second best digit. Conflicting givens come first, then the ones with
+        the smallest margin. Their second best digits are tried one and then
+        two at a time, until the board has exactly one solution. Repaired
+        digits are also corrected in the recognition cache
+
+        Args:
+            board (list[list[int]]): Board as it was recognized
+            squares (list[np.ndarray]): List of square images of the board
+
+        Returns:
+            list[list[int]] | None: Repaired board, None if no repair was found
+        """
+        filled = [i for i in range(81) if board[ROW_OF[i]][COL_OF[i]]]
+        if not filled:
+            return None
+        scores = digit_scores(
+            self.template_bank, [squares[i] for i in filled], self.recognizer, self.binarization, self.threshold
+        )
+        margins = score_margins(scores)
+        conflicts = {y * 9 + x for x, y in SudokuSolver.find_conflicts(board)}
+
+        # The best digit that differs from the one on the board, which can come from the cache
+        alternatives: dict[int, int] = {}
+        for k, i in enumerate(filled):
+            ranked = np.argsort(-scores[k]) + 1
+            alternatives[i] = int(next(n for n in ranked if n != board[ROW_OF[i]][COL_OF[i]]))
+
+        order = sorted(range(len(filled)), key=lambda k: (filled[k] not in conflicts, margins[k]))
+        suspects = [filled[k] for k in order[:REPAIR_SUSPECTS]]
+
+        attempts = 0
+        repaired: list[list[int]] | None = None
+        for changes in range(1, REPAIR_MAX_CHANGES + 1):
+            for combination in itertools.combinations(suspects, changes):
+                candidate = [list(row) for row in board]
+                for i in combination:
+                    candidate[ROW_OF[i]][COL_OF[i]] = alternatives[i]
+                if SudokuSolver.find_conflicts(candidate):
+                    continue
+                attempts += 1
+                if SudokuSolver.count_solutions(candidate, 2) == 1:
+                    repaired = candidate
+                    break
+            if repaired is not None:
+                break
+
+        self.instrumentation.count("repair.attempts", attempts)
+        if repaired is None:
+            return None
+
+        self.instrumentation.count("repair.squares", changes)
+        for i in combination:
+            x, y = COL_OF[i], ROW_OF[i]
+            print(f"Square ({x}, {y}) was read as {board[y][x]}, using {repaired[y][x]} instead.")
+            if self.recognition_cache is not None:
+                self.recognition_cache.put(self.recognition_cache.key(squares[i]), repaired[y][x])
+        return repaired
 
     def solve_on_screen(
         self,
         empty_squares: list[tuple[int, int]],
         solution: list[list[int]],
         board_data: dict[str, int]
-    ) -> None:
-        """Solves the sudoku on your phone
+    ) -> int:
+        """Solves the sudoku on your phone. The tap order comes from the
+        "input_strategy" entry of the board data, see plan_taps. In dry run
+        mode the taps are only counted and timed
 
         Args:
             empty_squares (list[tuple[int, int]]): A list containing the indexes of empty squares
             solution (list[list[int]]): Solution board
             board_data (dict[str, int]): Board data dictionary
+
+        Returns:
+            int: Number of taps
         """
         half_square_width = board_data["square_width"] // 2
         half_square_height = board_data["square_height"] // 2
@@ -400,28 +891,79 @@ class SudokuAutomator:
         answer_y: int = board_data["answer_y"]
         answer_distance = board_data["answer_distance"]
 
+        answer_buttons = [(answer_x + i * answer_distance, answer_y) for i in range(9)]
+
+        moves: list[tuple[tuple[int, int], int]] = []
+        columns, rows = self.get_square_offsets(board_data)
         for x, y in empty_squares:
             answer: int = solution[y][x]
-            square_pos = self.get_square_coords(board_data, x, y)
-            square_pos = square_pos[0] + half_square_width, square_pos[1] + half_square_height
+            square_pos = columns[x] + half_square_width, rows[y] + half_square_height
+            moves.append((square_pos, answer))
+
+        taps = plan_taps(moves, answer_buttons, board_data.get("input_strategy", "cell_first"))
 
-            answer_pos = answer_x + (answer - 1) * answer_distance, answer_y
+        if self.dry_run:
+            dry_run = DryRunInjector(self.input_mode, self.tap_delay, self.taps_per_second)
+            dry_run.send(taps)
+            print(f"Dry run: {dry_run.tap_count} taps, estimated {round(dry_run.estimate_seconds(), 2)} seconds with {self.input_mode} input.")
+            return len(taps)
 
-            self.device.shell(f"input tap {square_pos[0]} {square_pos[1]}")
-            self.device.shell(f"input tap {answer_pos[0]} {answer_pos[1]}")
+        if self.injector is None:
+            self.injector = create_injector(self.input_mode, self.device, self.tap_delay)
+
+        start_time = time.perf_counter()
+        self.injector.send(taps)
+        delta_time = time.perf_counter() - start_time
+
+        if taps and delta_time > 0:
+            self.taps_per_second = len(taps) / delta_time
+            print(f"Sent {len(taps)} taps in {round(delta_time, 2)} seconds ({round(self.taps_per_second, 1)} taps per second).")
+        return len(taps)
+
+    def time_stage(self, name: str, func, t0: float, message_before: str, message_after: str, *args: tuple) -> tuple:
+        """Times a pipeline stage with time_function inside an
+        instrumentation span of the given name
+
+        Args:
+            name (str): Name of the span
+            func (function): Function to time
+            t0 (float): Initial time in seconds
+            message_before (str): Message to print before timing the function
+            message_after (str): Message to print after timing the function
+
+        Returns:
+            tuple: Total time in seconds and the result of the function
+        """
+        with self.instrumentation.span(name):
+            return time_function(func, t0, message_before, message_after, *args)
 
     def run(self) -> None:
         """Runs the Automator"""
         time: float = 0.0
-        time: float = time_function(
-                            SudokuAutomator.connectToPhone,
-                            time,
-                            "Connecting to phone via ADB...",
-                            "Connected to phone!",
-                            self
-                        )[0]
+        if not self.screenshot_path:
+            time: float = self.time_stage(
+                                "connect",
+                                SudokuAutomator.connectToPhone,
+                                time,
+                                "Connecting to phone via ADB...",
+                                "Connected to phone!",
+                                self
+                            )[0]
+
+        self.solve_board(time)
+
+    def solve_board(self, time: float = 0.0) -> float:
+        """Reads the board on the screen, solves it and fills in the answers.
+        The phone has to be connected already
 
-        time, screenshot = time_function(
+        Args:
+            time (float, optional): Time already spent, in seconds. Defaults to 0.0.
+
+        Returns:
+            float: Total time in seconds
+        """
+        time, screenshot = self.time_stage(
+                                        "capture",
                                         SudokuAutomator.takeScreenshot,
                                         time,
                                         "Taking a screenshot...",
@@ -429,16 +971,30 @@ class SudokuAutomator:
                                         self
                                     )
 
-        time, board_data = time_function(
-                        SudokuAutomator.analyze_board,
-                        time,
-                        "Analyzing board...",
-                        "Board analyzed!",
-                        self, screenshot
-                        )
+        if self.board_data is None:
+            time, self.board_data = self.time_stage(
+                            "analyze",
+                            SudokuAutomator.analyze_board,
+                            time,
+                            "Analyzing board...",
+                            "Board analyzed!",
+                            self, screenshot
+                            )
+        board_data = self.board_data
+
+        if self.binarization == "threshold":
+            time, self.threshold = self.time_stage(
+                "threshold",
+                SudokuAutomator.compute_threshold,
+                time,
+                "Computing the board threshold...",
+                "Computed the board threshold!",
+                self, screenshot, board_data
+            )
 
         if self.debug:
-            time, img = time_function(
+            time, img = self.time_stage(
+                "crop",
                 SudokuAutomator.crop_image,
                 time,
                 "Cropping grid...",
@@ -447,7 +1003,8 @@ class SudokuAutomator:
             )
             img.save(f"{self.total_debug_path}/grid.png")
 
-        time, squares = time_function(
+        time, squares = self.time_stage(
+            "extract",
             SudokuAutomator.get_square_images,
             time,
             "Extracting squares...",
@@ -455,34 +1012,74 @@ class SudokuAutomator:
             self, screenshot, board_data
         )
 
-        time, board = time_function(
-            SudokuAutomator.squares_to_board,
-            time,
-            "Converting images to board...",
-            "Converted images to board!",
-            self, squares
-        )
+        tapped: dict[tuple[int, int], int] = {}
+        if self.stream:
+            time, (board, tapped) = self.time_stage(
+                "recognize",
+                SudokuAutomator.stream_board,
+                time,
+                "Converting images to board and sending forced answers...",
+                "Converted images to board!",
+                self, squares, board_data
+            )
+        else:
+            time, board = self.time_stage(
+                "recognize",
+                SudokuAutomator.squares_to_board,
+                time,
+                "Converting images to board...",
+                "Converted images to board!",
+                self, squares
+            )
+        self.report_cache()
 
-        time, empty_squares = time_function(
+        time, empty_squares = self.time_stage(
+            "empty_squares",
             SudokuAutomator.get_empty_squares,
             time,
             "Getting empty squares...",
             "Got empty squares!",
             self, board
         )
+        empty_squares = [square for square in empty_squares if square not in tapped]
 
-        time, solved_boards = time_function(
+        solver_stats: dict[str, int] = {}
+        time, solved_boards = self.time_stage(
+            "solve",
             SudokuSolver.solve,
             time,
             "Solving the board...",
             "Solved the board!",
-            board
+            board, self.solver_method, self.max_solutions, solver_stats
         )
 
+        if not solved_boards:
+            time, repaired = self.time_stage(
+                "repair",
+                SudokuAutomator.repair_board,
+                time,
+                "The board has no solution, looking for misread squares...",
+                "Looked for misread squares!",
+                self, board, squares
+            )
+            if repaired is not None:
+                board = repaired
+                solved_boards = SudokuSolver.solve(board, self.solver_method, self.max_solutions, solver_stats)
+        self.instrumentation.count_all(solver_stats, "solver.")
+
+        # The search stops after max_solutions, which is at least 2, so a single
+        # result means the board is unique and can be selected right away
         board_solution: list[list[int]] = None
-        if len(solved_boards) > 1:
-            print(f"Found {len(solved_boards)} solution(s).")
+        if len(solved_boards) > 1 and not self.interactive:
+            print(f"Found {len(solved_boards)} solution(s), using the first one.")
+            board_solution = solved_boards[0]
+        elif len(solved_boards) > 1:
+            if len(solved_boards) == self.max_solutions:
+                print(f"Found at least {len(solved_boards)} solution(s), showing the first {len(solved_boards)}.")
+            else:
+                print(f"Found {len(solved_boards)} solution(s).")
             print("Please select which solution you want to use:")
+            import readline  # noqa: F401, line editing for the prompt below
 
             for i, sb in enumerate(solved_boards):
                 print(i, np.matrix(sb))
@@ -504,13 +1101,317 @@ class SudokuAutomator:
         else:
             board_solution = solved_boards[0]
 
-        time = time_function(
+        if any(board_solution[y][x] != n for (x, y), n in tapped.items()):
+            raise RuntimeError("The board does not agree with the answers sent while it was read, a square was misread!")
+
+        time = self.time_stage(
+            "input",
             SudokuAutomator.solve_on_screen,
             time,
             "Solving the game on your phone...",
             "Solved the game on your phone!",
             self, empty_squares, board_solution, board_data
-        )
+        )[0]
+
+        self.instrumentation.flush("board")
+        return time
+
+    def run_loop(
+        self,
+        max_boards: int | None = None,
+        max_seconds: float | None = None,
+        poll_interval: float = 0.5,
+        stop_event: threading.Event | None = None
+    ) -> LoopStats:
+        """Keeps solving puzzles until a stop condition is met. The phone
+        is connected and the board is analyzed only once. Taps are sent on a
+        background thread, so the next frames are captured, recognized and
+        solved while the current board is still being filled in. A frame is
+        a new puzzle when it has empty squares and its digits do not fit the
+        solution of the previous one. A board that can not be solved is
+        counted as a failure once and not solved again while it stays on the
+        screen. Only squares that changed since the previous frame are
+        classified again
+
+        Args:
+            max_boards (int | None, optional): Stop after this many boards. Defaults to None.
+            max_seconds (float | None, optional): Stop after this many seconds. Defaults to None.
+            poll_interval (float, optional): Seconds to wait after a frame
+            without a new puzzle. Defaults to 0.5.
+            stop_event (threading.Event | None, optional): Stops the loop when set,
+            for example from another thread. Ctrl+C stops it too. Defaults to None.
+
+        Returns:
+            LoopStats: Summary statistics
+        """
+        stats = LoopStats()
+        stop_event = stop_event or threading.Event()
+
+        if not self.device and not self.screenshot_path:
+            self.connectToPhone()
+        if self.board_data is None:
+            self.board_data = self.analyze_board(self.takeScreenshot())
+        board_data = self.board_data
+        region_data = self.board_region_data(board_data)
+
+        last_solution: list[list[int]] = None
+        last_failure: list[list[int]] = None
+        pending_input: futures.Future = None
+        start_time = time.perf_counter()
+
+        def send_input(empty_squares: list[tuple[int, int]], solution: list[list[int]]) -> None:
+            with self.instrumentation.span("input") as span:
+                stats.taps += self.solve_on_screen(empty_squares, solution, board_data)
+            stats.stage_seconds["input"] += span["seconds"]
+
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            while not stop_event.is_set():
+                if max_boards is not None and stats.boards >= max_boards:
+                    break
+                if max_seconds is not None and time.perf_counter() - start_time >= max_seconds:
+                    break
+
+                with self.instrumentation.span("capture") as span:
+                    if self.capture == "raw" and not self.screenshot_path:
+                        frame, frame_data = self.takeBoardScreenshot(board_data), region_data
+                    else:
+                        frame, frame_data = self.takeScreenshot(), board_data
+                stats.stage_seconds["capture"] += span["seconds"]
+
+                with self.instrumentation.span("recognize") as span:
+                    if self.binarization == "threshold":
+                        threshold = self.compute_threshold(frame, frame_data)
+                        if threshold != self.threshold:
+                            # Squares read with another threshold can not be reused
+                            self.board_reader.reset()
+                        self.threshold = threshold
+                    squares = self.get_square_images(frame, frame_data)
+                    board = self.board_reader.read(squares)
+                stats.stage_seconds["recognize"] += span["seconds"]
+                stats.frames += 1
+                stats.reclassified += self.board_reader.last_changed
+
+                empty_squares = self.get_empty_squares(board)
+                same_puzzle = last_solution is not None and all(
+                    n == 0 or n == last_solution[y][x] for y, line in enumerate(board) for x, n in enumerate(line)
+                )
+                if not empty_squares or same_puzzle or board == last_failure:
+                    stop_event.wait(poll_interval)
+                    continue
+
+                solver_stats: dict[str, int] = {}
+                with self.instrumentation.span("solve") as span:
+                    solutions = SudokuSolver.solve(board, self.solver_method, 1, solver_stats)
+                    if not solutions:
+                        repaired = self.repair_board(board, squares)
+                        if repaired is not None:
+                            self.board_reader.correct(repaired)
+                            solutions = SudokuSolver.solve(repaired, self.solver_method, 1, solver_stats)
+                stats.stage_seconds["solve"] += span["seconds"]
+                self.instrumentation.count_all(solver_stats, "solver.")
+                if not solutions:
+                    stats.failures += 1
+                    last_failure = board
+                    stop_event.wait(poll_interval)
+                    continue
+
+                # A new puzzle can only show up once the previous one is filled in
+                if pending_input is not None:
+                    pending_input.result()
+                last_solution = solutions[0]
+                pending_input = executor.submit(send_input, empty_squares, last_solution)
+                stats.boards += 1
+                self.instrumentation.flush("board", board=stats.boards, frames=stats.frames)
+        except KeyboardInterrupt:
+            print("Stopping...")
+        finally:
+            if pending_input is not None:
+                pending_input.result()
+            executor.shutdown()
+            stats.seconds = time.perf_counter() - start_time
+            self.instrumentation.flush("loop")
+
+        print(stats.summary())
+        self.report_cache()
+        return stats
+
+
+def self_test() -> None:
+    """Runs the automator on synthetic screenshots with a fake phone and
+    raises AssertionError if anything does not behave as expected"""
+    from sudoku_benchmark import FakeDevice, synthetic_screenshot
+    from sudoku_corpus import parse_line
+    from sudoku_instrumentation import MemorySink
+
+    # Raw screencaps with either header size, in RGBA and BGRA order, and cut short
+    rgba = np.arange(3 * 2 * 4, dtype=np.uint8).reshape(2, 3, 4)
+    for header in (struct.pack("<III", 3, 2, 1), struct.pack("<IIII", 3, 2, 1, 0)):
+        pixels, header_size = parse_raw_screencap(header + rgba.tobytes())
+        assert header_size == len(header) and np.array_equal(pixels, rgba)
+    pixels, _ = parse_raw_screencap(struct.pack("<III", 3, 2, 5) + rgba[..., [2, 1, 0, 3]].tobytes())
+    assert np.array_equal(pixels, rgba)
+    for data in (b"", struct.pack("<III", 3, 2, 1) + rgba.tobytes()[:-1], struct.pack("<III", 3, 2, 4) + rgba.tobytes()):
+        try:
+            parse_raw_screencap(data)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a broken screencap was accepted")
+    print("Raw screencap test: header sizes, channel orders and short buffers are handled")
+
+    board = parse_line("53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79")
+    empty = sum(n == 0 for row in board for n in row)
+
+    # Streaming sends the forced answers before the board is solved, every empty square once
+    sink = MemorySink()
+    automator = SudokuAutomator(cache_mode="off", interactive=False, stream=True, instrumentation=Instrumentation([sink]))
+    screenshot, board_data = synthetic_screenshot(automator, board, 40, np.random.default_rng(0))
+    automator.board_data = board_data
+    automator.device = FakeDevice(screenshot)
+    automator.solve_board()
+    early = sink.counters()["stream.early_answers"]
+    solve_start = sink.spans("solve")[0]["time"]
+    assert 0 < early < empty
+    assert sum(t < solve_start for t in automator.device.command_times) == 2 * early
+    square_taps = automator.device.commands[::2]
+    assert len(automator.device.commands) == 2 * empty and len(set(square_taps)) == empty
+    assert all(int(tap.split()[3]) < board_data["answer_y"] - board_data["square_height"] for tap in square_taps)
+
+    # A failing tap is raised once the board is read, but does not hide a recognition error
+    tap_failed = threading.Event()
+
+    def failing_shell(command: str) -> str:
+        tap_failed.set()
+        raise ConnectionError("tap failed")
+
+    automator = SudokuAutomator(cache_mode="off", stream=True)
+    automator.device = FakeDevice(screenshot)
+    automator.device.shell = failing_shell
+    squares = automator.get_square_images(screenshot, board_data)
+    try:
+        automator.stream_board(squares, board_data)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("a failed tap was not raised")
+    recognize_squares = automator.recognize_squares
+    batches = []
+
+    def failing_recognize(batch: list[np.ndarray]) -> list[int]:
+        batches.append(batch)
+        if len(batches) == 4:
+            assert tap_failed.wait(5)
+            raise ValueError("recognition failed")
+        return recognize_squares(batch)
+
+    automator.recognize_squares = failing_recognize
+    tap_failed.clear()
+    try:
+        automator.stream_board(squares, board_data)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a failed recognition was not raised")
+    print("Streaming test: early answers are sent once and errors are not hidden")
+
+    # Squares repeated on a board are one cache miss, and cached digits need the same threshold
+    automator = SudokuAutomator(cache_mode="exact", binarization="threshold")
+    squares = automator.get_square_images(screenshot, board_data)
+    counters = automator.instrumentation.counters
+    automator.threshold = automator.compute_threshold(screenshot, board_data)
+    assert automator.squares_to_board(squares) == board
+    distinct = counters["recognition.classified"]
+    assert distinct == counters["recognition.cache_misses"] == automator.recognition_cache.misses < 81
+    assert counters["recognition.cache_hits"] == automator.recognition_cache.hits == 81 - distinct
+    automator.squares_to_board(squares)
+    assert counters["recognition.classified"] == distinct
+    automator.threshold += 1
+    assert automator.squares_to_board(squares) == board
+    assert counters["recognition.classified"] == 2 * distinct
+    print("Recognition cache test: repeated squares and threshold changes are counted and keyed")
+
+    # A misread given is found by its conflict and replaced by its next best digit
+    automator = SudokuAutomator(cache_mode="off", interactive=False)
+    squares = automator.get_square_images(screenshot, board_data)
+    misread = [list(row) for row in board]
+    misread[0][0] = 3  # The 3 at (1, 0) is in the same row
+    assert not SudokuSolver.solve(misread, "bitmask", 1)
+    repaired = automator.repair_board(misread, squares)
+    assert repaired == board and misread[0][0] == 3
+    assert automator.instrumentation.counters["repair.squares"] == 1
+
+    # The same misread coming from recognition still solves the board on the phone
+    recognize_squares = automator.recognize_squares
+
+    def misreading_recognize(batch: list[np.ndarray]) -> list[int]:
+        digits = recognize_squares(batch)
+        digits[0] = 3
+        return digits
+
+    automator.recognize_squares = misreading_recognize
+    automator.board_data = board_data
+    automator.device = FakeDevice(screenshot)
+    automator.solve_board()
+    assert len(automator.device.commands) == 2 * empty
+
+    # A board that no change of one or two squares makes unique is left alone
+    unsolvable = [[0] * 9 for _ in range(9)]
+    unsolvable[0][0] = unsolvable[0][5] = 5
+    unsolvable_screenshot, _ = synthetic_screenshot(automator, unsolvable, 40, np.random.default_rng(0))
+    squares = automator.get_square_images(unsolvable_screenshot, board_data)
+    assert automator.repair_board(unsolvable, squares) is None
+    assert unsolvable[0][0] == unsolvable[0][5] == 5
+    print("Repair test: a misread given is repaired, an unsolvable board is not")
+
+    # The loop solves each new puzzle once, counts a puzzle without solution once while it
+    # stays on the screen, and captures the next frames while the taps are still sent
+    class PuzzleSequence(FakeDevice):
+        """Shows the next puzzle once the current one got all of its taps, or
+        after a few frames for a puzzle that is never solved"""
+
+        def __init__(self, screenshots: list[Image.Image], taps: list[int | None]) -> None:
+            super().__init__(screenshots[0])
+            self.pngs: list[bytes] = [FakeDevice(screenshot).png for screenshot in screenshots]
+            self.taps: list[int | None] = taps
+            self.index: int = 0
+            self.frames: int = 0
+            self.tapped: int = 0
+            self.capture_times: list[float] = []
+
+        def next_puzzle(self) -> None:
+            self.index = min(self.index + 1, len(self.pngs) - 1)
+            self.frames = self.tapped = 0
+
+        def screencap(self) -> bytes:
+            self.capture_times.append(time.time())
+            if self.taps[self.index] is None and self.frames == 5:
+                self.next_puzzle()
+            self.frames += 1
+            return self.pngs[self.index]
+
+        def shell(self, command: str) -> str:
+            super().shell(command)
+            time.sleep(0.002)
+            self.tapped += 1
+            if self.tapped == self.taps[self.index]:
+                self.next_puzzle()
+            return ""
+
+    relabeled = [[n % 9 + 1 if n else 0 for n in row] for row in board]
+    puzzles = [board, unsolvable, relabeled]
+    automator = SudokuAutomator(cache_mode="exact", interactive=False)
+    automator.board_data = board_data
+    automator.device = PuzzleSequence(
+        [synthetic_screenshot(automator, puzzle, 40, np.random.default_rng(0))[0] for puzzle in puzzles],
+        [2 * empty, None, 2 * empty]
+    )
+    stats = automator.run_loop(max_boards=2, max_seconds=30, poll_interval=0.01)
+    assert (stats.boards, stats.failures, stats.taps) == (2, 1, 4 * empty)
+    assert len(automator.device.commands) == 4 * empty
+    first_tap, last_tap = automator.device.command_times[0], automator.device.command_times[2 * empty - 1]
+    assert any(first_tap < t < last_tap for t in automator.device.capture_times)
+    print("Loop test: puzzles are solved once, failures counted once and frames read while tapping")
 
 
 if __name__ == "__main__":
@@ -526,14 +1427,183 @@ if __name__ == "__main__":
         "-bd", "--boarddata",
         help="The file to read and store the board data."
     )
+    parser.add_argument(
+        "-sm", "--solver",
+        choices=METHODS,
+        default="bitmask",
+        help="The engine used to solve the board."
+    )
+    parser.add_argument(
+        "-ms", "--maxsolutions",
+        type=int,
+        default=10,
+        help="The maximum number of solutions to search for when the board is not unique. "
+             "At least 2, because a second solution is needed to tell that the board is not unique."
+    )
+    parser.add_argument(
+        "-b", "--binarization",
+        choices=BINARIZATIONS,
+        default="otsu",
+        help="How cells are split into digit and background before matching. "
+             "\"threshold\" computes one threshold per screenshot, \"otsu\" one per cell."
+    )
+    parser.add_argument(
+        "-r", "--recognizer",
+        choices=RECOGNIZERS,
+        default="ncc",
+        help="How digits are matched against the templates. "
+             "\"ncc\" scores the whole board in one batched pass, \"ssim\" compares cell by cell."
+    )
+    parser.add_argument(
+        "-c", "--capture",
+        choices=CAPTURE_MODES,
+        default="png",
+        help="How screenshots are taken. \"raw\" reads the framebuffer without PNG encoding, which is faster on most phones."
+    )
+    parser.add_argument(
+        "-i", "--input",
+        choices=INPUT_MODES,
+        default="tap",
+        help="How taps are sent. \"batch\" sends many taps in one shell command, "
+             "\"sendevent\" writes touch events straight to the touchscreen."
+    )
+    parser.add_argument(
+        "-td", "--tapdelay",
+        type=float,
+        default=0.0,
+        help="Seconds to wait between two taps, in case the game drops taps that come too fast."
+    )
+    parser.add_argument(
+        "-dr", "--dryrun",
+        action="store_true",
+        help="Count the taps needed and estimate how long they take instead of sending them."
+    )
+    parser.add_argument(
+        "-ss", "--screenshot",
+        help="Read the board from this screenshot file instead of your phone. Implies --dryrun."
+    )
+    parser.add_argument(
+        "-s", "--serial",
+        help="Serial number of the phone to use when more than one is attached."
+    )
+    parser.add_argument(
+        "-l", "--loop",
+        action="store_true",
+        help="Keep solving new puzzles until stopped with Ctrl+C or a limit below is reached."
+    )
+    parser.add_argument(
+        "--maxboards",
+        type=int,
+        help="Stop the loop after this many boards."
+    )
+    parser.add_argument(
+        "--maxseconds",
+        type=float,
+        help="Stop the loop after this many seconds."
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=0.5,
+        help="Seconds to wait in the loop when there is no new puzzle on the screen."
+    )
+    parser.add_argument(
+        "--cache",
+        choices=CACHE_MODES,
+        default="exact",
+        help="Reuse recognized digits for squares that look the same. \"exact\" needs identical pixels, "
+             "\"perceptual\" only a similar shape."
+    )
+    parser.add_argument(
+        "--persistcache",
+        action="store_true",
+        help="Keep the recognition cache in a file next to the board data file between runs."
+    )
+    parser.add_argument(
+        "--calibration",
+        choices=CALIBRATION_MODES,
+        default="auto",
+        help="How the board is measured when there is no board data file. "
+             "\"auto\" finds it on the screenshot and only asks questions if that fails."
+    )
+    parser.add_argument(
+        "-p", "--profiles",
+        help="A file with the board data of several phones, picked by device model and screen resolution. "
+             "Used instead of the board data file, missing profiles are measured and added."
+    )
+    parser.add_argument(
+        "-rw", "--recognitionworkers",
+        type=int,
+        default=1,
+        help="Recognize the squares on this many processes. Helps most with the slower ssim recognizer."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Start tapping the answers that are already certain while the rest of the board is still being read."
+    )
+    parser.add_argument(
+        "--trace",
+        help="Append a JSON line for every timed stage and the recognition and solver counters of every board to this file."
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="+",
+        default=[],
+        metavar="STAGE",
+        help="Profile these stages with cProfile, for example recognize or solve, or \"all\" for every stage."
+    )
+    parser.add_argument(
+        "--profiledir",
+        default="profiles",
+        help="The folder the profiles are saved to."
+    )
+    parser.add_argument(
+        "--selftest",
+        action="store_true",
+        help="Checks the automator on synthetic screenshots with a fake phone instead of solving a board."
+    )
     args = parser.parse_args()
+    if args.selftest:
+        self_test()
+        parser.exit()
+    if args.maxsolutions < 2:
+        parser.error("argument -ms/--maxsolutions: must be at least 2")
 
     if args.boarddata is None:
         args.boarddata = "board_data.json"
 
     try:
-        automator = SudokuAutomator(args.debug, args.boarddata)
-        automator.run()
+        automator = SudokuAutomator(
+            args.debug,
+            args.boarddata,
+            solver_method=args.solver,
+            max_solutions=args.maxsolutions,
+            binarization=args.binarization,
+            recognizer=args.recognizer,
+            capture=args.capture,
+            input_mode=args.input,
+            tap_delay=args.tapdelay,
+            dry_run=args.dryrun or args.screenshot is not None,
+            screenshot_path=args.screenshot,
+            serial=args.serial,
+            interactive=not args.loop,
+            cache_mode=args.cache,
+            persist_cache=args.persistcache,
+            calibration=args.calibration,
+            profiles_filename=args.profiles,
+            recognition_workers=args.recognitionworkers,
+            stream=args.stream,
+            instrumentation=Instrumentation(
+                [JsonLinesSink(args.trace)] if args.trace else [],
+                args.profile,
+                args.profiledir
+            )
+        )
+        if args.loop:
+            automator.run_loop(args.maxboards, args.maxseconds, args.poll)
+        else:
+            automator.run()
     except RuntimeError as re:
         print(f"A runtime error occured: {re}")
     except Exception as e:
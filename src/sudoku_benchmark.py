@@ -0,0 +1,696 @@
+from PIL import Image
+from sudoku_automator import SudokuAutomator
+from sudoku_corpus import parse_line
+from sudoku_lazy import lazy_import
+from sudoku_recognition import BINARIZATIONS, CACHE_MODES, RECOGNIZERS, binarize, board_threshold
+from sudoku_solver import METHODS, SudokuSolver
+import time
+import numpy as np
+import argparse
+import datetime
+import io
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+
+cv2 = lazy_import("cv2")
+KMeans = lazy_import("sklearn.cluster", "KMeans")
+ssim = lazy_import("skimage.metrics", "structural_similarity")
+
+
+GIVEN_COLOR = (52, 72, 97)
+ENTERED_COLOR = (38, 110, 214)
+
+# Code timed by the startup benchmark, and modules none of them should load
+STARTUP_TARGETS: dict[str, str] = {
+    "solver": "import sudoku_solver",
+    "automator": "import sudoku_automator",
+    "automator+templates": "import sudoku_automator; sudoku_automator.SudokuAutomator(cache_mode='off')",
+}
+HEAVY_MODULES: tuple[str, ...] = ("cv2", "sklearn", "skimage", "ppadb", "readline")
+
+# Published puzzles with a unique solution, "." for empty squares
+KNOWN_PUZZLES: dict[str, dict[str, str]] = {
+    "17-clue": {
+        "royle-1": "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+        "royle-2": "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+        "royle-3": "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+    },
+    "hardest": {
+        "inkala-2012": "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+        "ai-escargot": "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+    },
+}
+# Generated difficulty levels and the number of givens they keep
+GENERATED_CLUES: dict[str, int] = {"easy": 40, "medium": 32, "hard": 26}
+PERCENTILES: tuple[int, ...] = (50, 90, 99)
+
+
+def synthetic_cell(
+    template: np.ndarray,
+    size: int,
+    rng: np.random.Generator,
+    foreground: tuple = GIVEN_COLOR,
+    noise: float = 2.0
+) -> Image.Image:
+    """Renders a number template the way it looks on a phone screenshot:
+    coloured, scaled to the cell size, anti-aliased and slightly noisy
+
+    Args:
+        template (np.ndarray): Grayscale template, black digit on white
+        size (int): Width and height of the cell in pixels
+        rng (np.random.Generator): Random generator for the noise
+        foreground (tuple, optional): RGB colour of the digit. Defaults to GIVEN_COLOR.
+        noise (float, optional): Standard deviation of the pixel noise. Defaults to 2.0.
+
+    Returns:
+        Image.Image: RGBA cell image
+    """
+    background = np.array([246, 241, 232], dtype=np.float32)
+    foreground = np.array(foreground, dtype=np.float32)
+
+    alpha = cv2.resize(template, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+    rgb = alpha[..., None] * background + (1 - alpha[..., None]) * foreground
+    rgb += rng.normal(0, noise, rgb.shape)
+    rgba = np.dstack((np.clip(rgb, 0, 255).astype(np.uint8), np.full((size, size), 255, np.uint8)))
+    return Image.fromarray(rgba, "RGBA")
+
+
+def legacy_square_to_int(automator: SudokuAutomator, square_img: Image.Image) -> int:
+    """The original square_to_int with the per-pixel Python loop, kept as
+    the baseline for the cell benchmark"""
+    primary_color = (255, 255, 255, 255)
+    secondary_color = (0, 0, 0, 255)
+
+    opencv_image = np.array(square_img)
+    reshaped_image = cv2.cvtColor(opencv_image, cv2.COLOR_RGBA2RGB).reshape(-1, 3)
+
+    if (reshaped_image == reshaped_image[0]).all() == 1:
+        return 0
+
+    kmeans = KMeans(n_clusters=2, n_init='auto')
+    kmeans.fit(reshaped_image)
+
+    labels = kmeans.labels_
+    unique_labels, counts = np.unique(labels, return_counts=True)
+    primary_number = unique_labels[0] if counts[0] > counts[1] else unique_labels[1]
+
+    labels = labels.reshape(opencv_image.shape[0], opencv_image.shape[1])
+    for y in range(opencv_image.shape[0]):
+        for x in range(opencv_image.shape[1]):
+            if labels[y, x] == primary_number:
+                opencv_image[y, x] = primary_color
+            else:
+                opencv_image[y, x] = secondary_color
+
+    gray_img = cv2.cvtColor(opencv_image, cv2.COLOR_RGB2GRAY)
+    if gray_img.shape != automator.number_squares[0].shape:
+        gray_img = cv2.resize(gray_img, automator.number_squares[0].shape)
+
+    ssim_list = [ssim(gray_img, automator.number_squares[i]) for i in range(0, 9)]
+    return ssim_list.index(max(ssim_list)) + 1
+
+
+def time_per_cell(func, cells: list[Image.Image], repeat: int) -> tuple[float, list[int]]:
+    """Runs a recognition function over all cells and returns the best
+    per-cell latency in milliseconds together with the recognized digits.
+    One untimed call comes first, so lazy imports and first-call setup are
+    not counted"""
+    func(cells[0])
+    best = float("inf")
+    digits: list[int] = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        digits = [func(cell) for cell in cells]
+        best = min(best, time.perf_counter() - start_time)
+    return best / len(cells) * 1000, digits
+
+
+def benchmark_cell(args: argparse.Namespace) -> None:
+    """Compares the per-cell latency of the legacy and the current square_to_int"""
+    automator = SudokuAutomator()
+    rng = np.random.default_rng(args.seed)
+    cells = [synthetic_cell(automator.number_squares[i % 9], args.size, rng) for i in range(args.cells)]
+    expected = [i % 9 + 1 for i in range(args.cells)]
+
+    before, before_digits = time_per_cell(lambda c: legacy_square_to_int(automator, c), cells, args.repeat)
+    after, after_digits = time_per_cell(automator.square_to_int, cells, args.repeat)
+
+    print(f"Cells: {len(cells)} of {args.size}x{args.size} pixels")
+    print(f"Before: {before:.2f} ms per cell, {sum(d == e for d, e in zip(before_digits, expected))} correct")
+    print(f"After:  {after:.2f} ms per cell, {sum(d == e for d, e in zip(after_digits, expected))} correct")
+    print(f"Speedup: {before / after:.1f}x, identical output: {before_digits == after_digits}")
+
+
+def benchmark_binarize(args: argparse.Namespace) -> None:
+    """Compares the accuracy and per-cell latency of the binarization
+    strategies on synthetic cells with given and entered digit colours"""
+    automator = SudokuAutomator()
+    rng = np.random.default_rng(args.seed)
+
+    cells: list[Image.Image] = []
+    expected: list[int] = []
+    for size in args.sizes:
+        for noise in args.noise:
+            for foreground in (GIVEN_COLOR, ENTERED_COLOR):
+                for i in range(9):
+                    cells.append(synthetic_cell(automator.number_squares[i], size, rng, foreground, noise))
+                    expected.append(i + 1)
+
+    rgb_cells = [np.asarray(cell.convert("RGB")) for cell in cells]
+
+    print(f"Cells: {len(cells)}, sizes {args.sizes}, noise {args.noise}")
+    print(f"{'Method':<10} {'Binarize ms/cell':>17} {'Total ms/cell':>14} {'Accuracy':>9}")
+    for method in BINARIZATIONS:
+        automator.binarization = method
+        automator.threshold = None
+        threshold_time = 0.0
+        if method == "threshold":
+            # One threshold per screenshot, here computed over all cells at once
+            board_threshold(rgb_cells[0])
+            start_time = time.perf_counter()
+            automator.threshold = board_threshold(np.concatenate([rgb.reshape(-1, 1, 3) for rgb in rgb_cells]))
+            threshold_time = (time.perf_counter() - start_time) / len(cells) * 1000
+
+        binarize_latency, _ = time_per_cell(
+            lambda rgb: binarize(rgb, method, automator.threshold), rgb_cells, args.repeat
+        )
+        latency, digits = time_per_cell(automator.square_to_int, cells, args.repeat)
+        accuracy = sum(d == e for d, e in zip(digits, expected)) / len(cells)
+        print(
+            f"{method:<10} {binarize_latency + threshold_time:>17.3f} "
+            f"{latency + threshold_time:>14.2f} {accuracy:>9.1%}"
+        )
+
+
+def synthetic_board(
+    automator: SudokuAutomator,
+    size: int,
+    rng: np.random.Generator,
+    noise: float = 2.0
+) -> tuple[list[Image.Image], list[list[int]]]:
+    """Renders 81 squares of a random board, about half of them empty
+
+    Args:
+        automator (SudokuAutomator): Automator with the number templates loaded
+        size (int): Width and height of a square in pixels
+        rng (np.random.Generator): Random generator for digits and noise
+        noise (float, optional): Standard deviation of the pixel noise. Defaults to 2.0.
+
+    Returns:
+        tuple[list[Image.Image], list[list[int]]]: The squares in row-major
+        order and the board they show
+    """
+    digits = rng.integers(1, 10, 81) * (rng.random(81) < 0.5)
+    empty = Image.new("RGBA", (size, size), (246, 241, 232, 255))
+    squares = [
+        synthetic_cell(automator.number_squares[d - 1], size, rng, GIVEN_COLOR, noise) if d else empty
+        for d in digits
+    ]
+    return squares, digits.reshape(9, 9).tolist()
+
+
+def benchmark_board(args: argparse.Namespace) -> None:
+    """Compares the per-board latency and accuracy of the recognizers,
+    sequentially and on a process pool"""
+    automator = SudokuAutomator(cache_mode="off")
+    rng = np.random.default_rng(args.seed)
+    boards = [synthetic_board(automator, args.size, rng, args.noise) for _ in range(args.boards)]
+    worker_counts = [1] if args.workers <= 1 else [1, args.workers]
+
+    print(f"Boards: {len(boards)} with {args.size}x{args.size} pixel squares")
+    print(f"{'Recognizer':<11} {'Workers':>8} {'ms/board':>9} {'Accuracy':>9}")
+    for recognizer in RECOGNIZERS:
+        automator.recognizer = recognizer
+        sequential: list[list[list[int]]] = []
+        for workers in worker_counts:
+            automator.recognition_workers = workers
+            best = float("inf")
+            correct = 0
+            read: list[list[list[int]]] = []
+            for _ in range(args.repeat):
+                correct = 0
+                read = []
+                start_time = time.perf_counter()
+                for squares, expected in boards:
+                    board = automator.squares_to_board(squares)
+                    read.append(board)
+                    correct += sum(a == b for row_a, row_b in zip(board, expected) for a, b in zip(row_a, row_b))
+                best = min(best, time.perf_counter() - start_time)
+
+            line = f"{recognizer:<11} {workers:>8} {best / len(boards) * 1000:>9.1f} {correct / (81 * len(boards)):>9.1%}"
+            if workers == 1:
+                sequential = read
+            else:
+                line += f"  identical to sequential: {read == sequential}"
+            print(line)
+
+    if automator.parallel_recognizer is not None:
+        automator.parallel_recognizer.close()
+
+
+def generate_puzzle(rng: np.random.Generator, clues: int) -> list[list[int]]:
+    """Generates a puzzle with a unique solution by shuffling a solved board
+    and clearing squares as long as the solution stays unique
+
+    Args:
+        rng (np.random.Generator): Random generator
+        clues (int): Number of givens to stop at. Hard targets may not be
+        reached, then the puzzle keeps a few more
+
+    Returns:
+        list[list[int]]: Board with zeros for empty squares
+    """
+    solution = np.array(SudokuSolver.solve([[0] * 9 for _ in range(9)], max_solutions=1)[0])
+    digits = np.concatenate(([0], rng.permutation(9) + 1))
+    rows = np.concatenate([band * 3 + rng.permutation(3) for band in rng.permutation(3)])
+    columns = np.concatenate([stack * 3 + rng.permutation(3) for stack in rng.permutation(3)])
+    board = digits[solution[rows][:, columns]].tolist()
+
+    givens = 81
+    for i in rng.permutation(81):
+        if givens <= clues:
+            break
+        y, x = divmod(int(i), 9)
+        digit, board[y][x] = board[y][x], 0
+        if SudokuSolver.is_unique(board):
+            givens -= 1
+        else:
+            board[y][x] = digit
+    return board
+
+
+def puzzle_set(rng: np.random.Generator, generated: int) -> list[tuple[str, str, list[list[int]]]]:
+    """Collects the puzzles of the end-to-end benchmark
+
+    Args:
+        rng (np.random.Generator): Random generator for the generated puzzles
+        generated (int): Number of generated puzzles per difficulty level
+
+    Returns:
+        list[tuple[str, str, list[list[int]]]]: Difficulty, name and board of each puzzle
+    """
+    puzzles = []
+    for level, clues in GENERATED_CLUES.items():
+        for i in range(generated):
+            puzzles.append((level, f"{level}-{i + 1}", generate_puzzle(rng, clues)))
+    for level, named in KNOWN_PUZZLES.items():
+        for name, text in named.items():
+            puzzles.append((level, name, parse_line(text)))
+    return puzzles
+
+
+def synthetic_screenshot(
+    automator: SudokuAutomator,
+    board: list[list[int]],
+    size: int,
+    rng: np.random.Generator,
+    noise: float = 2.0
+) -> tuple[Image.Image, dict[str, int]]:
+    """Renders a phone screenshot of a board with thin lines between
+    squares, thick lines between boxes and a dark frame around it, and a
+    row of answer buttons below the board, so it can also be calibrated
+
+    Args:
+        automator (SudokuAutomator): Automator with the number templates loaded
+        board (list[list[int]]): Board to draw, zeros stay empty
+        size (int): Width and height of a square in pixels
+        rng (np.random.Generator): Random generator for the noise
+        noise (float, optional): Standard deviation of the pixel noise. Defaults to 2.0.
+
+    Returns:
+        tuple[Image.Image, dict[str, int]]: The screenshot and its board data
+    """
+    gaps = [max(1, size // 30), max(1, size // 30), max(2, size // 15)] * 2 + [max(1, size // 30)] * 2
+    board_size = 9 * size + sum(gaps)
+    border = max(2, size // 15)
+    answer_distance = board_size // 9
+    board_data = {
+        "board_width": board_size,
+        "board_height": board_size,
+        "square_x": 40,
+        "square_y": 210,
+        "square_width": size,
+        "square_height": size,
+        "horizontal_gaps": gaps,
+        "vertical_gaps": gaps,
+        "answer_x": 40 + answer_distance // 2,
+        "answer_y": 210 + board_size + 2 * size,
+        "answer_distance": answer_distance,
+    }
+
+    screen = Image.new("RGBA", (board_size + 80, board_size + 510), (255, 255, 255, 255))
+    screen.paste((60, 60, 60, 255), (40 - border, 210 - border, 40 + board_size + border, 210 + board_size + border))
+    empty = Image.new("RGBA", (size, size), (246, 241, 232, 255))
+    columns, rows = automator.get_square_offsets(board_data)
+    for y, line in enumerate(board):
+        for x, digit in enumerate(line):
+            square = synthetic_cell(automator.number_squares[digit - 1], size, rng, GIVEN_COLOR, noise) if digit else empty
+            screen.paste(square, (columns[x], rows[y]))
+
+    for digit in range(9):
+        button = synthetic_cell(automator.number_squares[digit], size, rng, GIVEN_COLOR, noise)
+        center_x = board_data["answer_x"] + digit * answer_distance
+        screen.paste(button, (center_x - size // 2, board_data["answer_y"] - size // 2))
+    return screen, board_data
+
+
+class FakeDevice:
+    """Stands in for a phone without ADB: returns a fixed screenshot and
+    records the shell commands and the wall clock time each of them arrived"""
+
+    def __init__(self, screenshot: Image.Image) -> None:
+        buffer = io.BytesIO()
+        screenshot.save(buffer, format="PNG")
+        self.png: bytes = buffer.getvalue()
+        self.commands: list[str] = []
+        self.command_times: list[float] = []
+
+    def screencap(self) -> bytes:
+        return self.png
+
+    def shell(self, command: str) -> str:
+        self.commands.append(command)
+        self.command_times.append(time.time())
+        return ""
+
+
+def load_corpus(folder: str) -> list[tuple[str, Image.Image, dict[str, int], list[list[int]]]]:
+    """Loads recorded screenshots. Every "name.png" needs a "name.json" with
+    the puzzle it shows as an 81 character "puzzle" string, and optionally
+    its "board_data". Screenshots without board data are calibrated
+    automatically
+
+    Args:
+        folder (str): Corpus folder
+
+    Returns:
+        list[tuple[str, Image.Image, dict[str, int], list[list[int]]]]: Name,
+        screenshot, board data and expected board of each recording
+    """
+    from sudoku_calibration import calibrate
+
+    corpus = []
+    for screenshot_path in sorted(pathlib.Path(folder).glob("*.png")):
+        with open(screenshot_path.with_suffix(".json"), "r") as file:
+            record = json.load(file)
+        screenshot = Image.open(screenshot_path).convert("RGBA")
+        board_data = record.get("board_data") or calibrate(np.asarray(screenshot))
+        corpus.append((screenshot_path.stem, screenshot, board_data, parse_line(record["puzzle"])))
+    return corpus
+
+
+def calibration_matches(measured: dict[str, int], expected: dict[str, int]) -> bool:
+    """Checks a calibrated board data against the known one. The grid has
+    to match exactly, the answer buttons within a quarter of a square
+
+    Args:
+        measured (dict[str, int]): Board data found by the calibration
+        expected (dict[str, int]): Board data the screenshot was drawn with
+
+    Returns:
+        bool: Whether the calibration found the same board and buttons
+    """
+    grid_keys = ("square_x", "square_y", "square_width", "square_height", "horizontal_gaps", "vertical_gaps")
+    if any(measured.get(key) != expected[key] for key in grid_keys):
+        return False
+    tolerance = expected["square_width"] // 4
+    return all(
+        key not in expected or abs(measured.get(key, -tolerance - 1) - expected[key]) <= tolerance
+        for key in ("answer_x", "answer_y", "answer_distance")
+    )
+
+
+def latency_summary(seconds: list[float]) -> dict[str, float]:
+    """Summarizes latencies in milliseconds
+
+    Args:
+        seconds (list[float]): Latencies in seconds
+
+    Returns:
+        dict[str, float]: Count, mean, percentiles and maximum
+    """
+    ms = np.array(seconds) * 1000
+    summary = {"count": len(ms), "mean_ms": round(float(ms.mean()), 3)}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}_ms"] = round(float(np.percentile(ms, percentile)), 3)
+    summary["max_ms"] = round(float(ms.max()), 3)
+    return summary
+
+
+def git_commit() -> str | None:
+    """Gets the commit the benchmark runs on
+
+    Returns:
+        str | None: Commit hash, None outside of a git checkout
+    """
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=pathlib.Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def benchmark_e2e(args: argparse.Namespace) -> None:
+    """Runs calibration, square extraction, recognition and solving on
+    screenshots without a phone and reports per-stage latency percentiles,
+    calibration and recognition accuracy and solve latency per difficulty
+    level"""
+    from sudoku_calibration import calibrate
+
+    automator = SudokuAutomator(
+        binarization=args.binarization,
+        recognizer=args.recognizer,
+        cache_mode=args.cache,
+        solver_method=args.solver,
+        recognition_workers=args.workers,
+    )
+    rng = np.random.default_rng(args.seed)
+    puzzles = puzzle_set(rng, args.generated)
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = []
+        for level, name, board in puzzles:
+            screenshot, board_data = synthetic_screenshot(automator, board, args.size, rng, args.noise)
+            corpus.append((name, screenshot, board_data, board))
+
+    stage_seconds: dict[str, list[float]] = {"calibrate": [], "extract": [], "recognize": [], "solve": [], "total": []}
+    correct_squares, correct_boards, solved_boards, calibrated_boards = 0, 0, 0, 0
+    for _ in range(args.repeat):
+        correct_squares, correct_boards, solved_boards, calibrated_boards = 0, 0, 0, 0
+        for name, screenshot, board_data, expected in corpus:
+            start_time = time.perf_counter()
+            try:
+                calibrated_boards += calibration_matches(calibrate(np.asarray(screenshot)), board_data)
+            except RuntimeError:
+                pass
+            stage_seconds["calibrate"].append(time.perf_counter() - start_time)
+
+            automator.threshold = None
+            if args.binarization == "threshold":
+                automator.threshold = automator.compute_threshold(screenshot, board_data)
+
+            start_time = time.perf_counter()
+            squares = automator.get_square_images(screenshot, board_data)
+            extracted_time = time.perf_counter()
+            board = automator.squares_to_board(squares)
+            recognized_time = time.perf_counter()
+            solutions = SudokuSolver.solve(board, args.solver, 2)
+            solved_time = time.perf_counter()
+
+            stage_seconds["extract"].append(extracted_time - start_time)
+            stage_seconds["recognize"].append(recognized_time - extracted_time)
+            stage_seconds["solve"].append(solved_time - recognized_time)
+            stage_seconds["total"].append(solved_time - start_time)
+
+            correct = sum(a == b for row_a, row_b in zip(board, expected) for a, b in zip(row_a, row_b))
+            correct_squares += correct
+            correct_boards += correct == 81
+            solved_boards += len(solutions) == 1
+
+    solver_seconds: dict[str, list[float]] = {}
+    for level, name, board in puzzles:
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            SudokuSolver.solve(board, args.solver, 2)
+            solver_seconds.setdefault(level, []).append(time.perf_counter() - start_time)
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "settings": {
+            "corpus": args.corpus or f"synthetic {args.size}px, noise {args.noise}",
+            "screenshots": len(corpus),
+            "repeat": args.repeat,
+            "binarization": args.binarization,
+            "recognizer": args.recognizer,
+            "cache": args.cache,
+            "solver": args.solver,
+            "workers": args.workers,
+            "seed": args.seed,
+        },
+        "stages": {stage: latency_summary(seconds) for stage, seconds in stage_seconds.items()},
+        "accuracy": {
+            "squares": round(correct_squares / (81 * len(corpus)), 4),
+            "boards": round(correct_boards / len(corpus), 4),
+            "solved": round(solved_boards / len(corpus), 4),
+            "calibrated": round(calibrated_boards / len(corpus), 4),
+        },
+        "solver": {level: latency_summary(seconds) for level, seconds in solver_seconds.items()},
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+
+    print(f"Screenshots: {len(corpus)} ({results['settings']['corpus']}), repeat {args.repeat}")
+    print(f"{'Stage':<10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for title, summaries in (("Pipeline", results["stages"]), ("Solver", results["solver"])):
+        print(f"{title}:")
+        for stage, summary in summaries.items():
+            line = (f"  {stage:<8} {summary['p50_ms']:>8.2f} {summary['p90_ms']:>8.2f} "
+                    f"{summary['p99_ms']:>8.2f} {summary['max_ms']:>8.2f}")
+            previous = (baseline or {}).get("stages" if title == "Pipeline" else "solver", {}).get(stage)
+            if previous and previous["p50_ms"] > 0:
+                line += f"  p50 {(summary['p50_ms'] / previous['p50_ms'] - 1):+.1%} vs baseline"
+            print(line)
+    accuracy = results["accuracy"]
+    print(f"Accuracy: {accuracy['squares']:.2%} of squares, {accuracy['boards']:.2%} of boards read correctly, "
+          f"{accuracy['solved']:.2%} solved uniquely, {accuracy['calibrated']:.2%} calibrated correctly")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+        print(f"Results written to {args.output}")
+
+    if automator.parallel_recognizer is not None:
+        automator.parallel_recognizer.close()
+
+
+def import_times(code: str) -> tuple[float, dict[str, float]]:
+    """Runs code in a fresh interpreter with "-X importtime"
+
+    Args:
+        code (str): Python code to run
+
+    Returns:
+        tuple[float, dict[str, float]]: Total import time in milliseconds and
+        the time spent in the modules of every top level package
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=pathlib.Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    packages: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1000
+    return sum(packages.values()), packages
+
+
+def benchmark_startup(args: argparse.Namespace) -> None:
+    """Measures the import time of the solver and the automator against a budget"""
+    budgets = {"solver": args.solver_budget, "automator": args.automator_budget,
+               "automator+templates": args.automator_budget}
+
+    over_budget = False
+    print(f"{'Target':<20} {'Import ms':>10} {'Budget ms':>10}  Heaviest packages")
+    for target, code in STARTUP_TARGETS.items():
+        runs = [import_times(code) for _ in range(args.repeat)]
+        total, packages = min(runs, key=lambda run: run[0])
+        heaviest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        status = "" if total <= budgets[target] else " OVER BUDGET"
+        over_budget |= bool(status)
+        print(f"{target:<20} {total:>10.1f} {budgets[target]:>10.1f}  "
+              f"{', '.join(f'{name} {ms:.0f}' for name, ms in heaviest)}{status}")
+
+        check = f"{code}; import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+        loaded = subprocess.run(
+            [sys.executable, "-c", check],
+            cwd=pathlib.Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        if loaded:
+            print(f"{'':<20} loads {loaded} at startup")
+
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks for the sudoku automator."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cell_parser = subparsers.add_parser("cell", help="Per-cell recognition latency before and after vectorization.")
+    cell_parser.add_argument("--cells", type=int, default=27, help="Number of synthetic cells to recognize.")
+    cell_parser.add_argument("--size", type=int, default=118, help="Cell size in pixels.")
+    cell_parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported.")
+    cell_parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic noise.")
+    cell_parser.set_defaults(func=benchmark_cell)
+
+    binarize_parser = subparsers.add_parser("binarize", help="Accuracy and latency of each binarization strategy.")
+    binarize_parser.add_argument("--sizes", type=int, nargs="+", default=[96, 118, 140], help="Cell sizes in pixels.")
+    binarize_parser.add_argument("--noise", type=float, nargs="+", default=[2.0, 8.0], help="Pixel noise levels.")
+    binarize_parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported.")
+    binarize_parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic noise.")
+    binarize_parser.set_defaults(func=benchmark_binarize)
+
+    board_parser = subparsers.add_parser("board", help="Whole-board recognition latency of each recognizer.")
+    board_parser.add_argument("--boards", type=int, default=5, help="Number of synthetic boards to recognize.")
+    board_parser.add_argument("--size", type=int, default=118, help="Square size in pixels.")
+    board_parser.add_argument("--noise", type=float, default=4.0, help="Pixel noise level.")
+    board_parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported.")
+    board_parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic boards.")
+    board_parser.add_argument("--workers", type=int, default=1,
+                              help="Also recognize on this many processes and compare with the sequential result.")
+    board_parser.set_defaults(func=benchmark_board)
+
+    e2e_parser = subparsers.add_parser("e2e", help="Extraction, recognition and solving on screenshots without a phone.")
+    e2e_parser.add_argument("--corpus", help="Folder with recorded screenshots, see load_corpus. "
+                                             "Synthetic screenshots of the puzzle set are used if not given.")
+    e2e_parser.add_argument("--generated", type=int, default=5, help="Generated puzzles per difficulty level.")
+    e2e_parser.add_argument("--size", type=int, default=100, help="Square size of synthetic screenshots in pixels.")
+    e2e_parser.add_argument("--noise", type=float, default=4.0, help="Pixel noise of synthetic screenshots.")
+    e2e_parser.add_argument("-b", "--binarization", choices=BINARIZATIONS, default="otsu", help="Binarization strategy.")
+    e2e_parser.add_argument("-r", "--recognizer", choices=RECOGNIZERS, default="ncc", help="Digit recognizer.")
+    e2e_parser.add_argument("--cache", choices=CACHE_MODES, default="off", help="Recognition cache mode.")
+    e2e_parser.add_argument("-sm", "--solver", choices=METHODS, default="bitmask", help="Solver engine.")
+    e2e_parser.add_argument("--workers", type=int, default=1, help="Recognition worker processes.")
+    e2e_parser.add_argument("--repeat", type=int, default=3, help="Number of runs over the corpus.")
+    e2e_parser.add_argument("--seed", type=int, default=0, help="Seed for generated puzzles and noise.")
+    e2e_parser.add_argument("-o", "--output", help="Write the results as JSON to this file.")
+    e2e_parser.add_argument("--baseline", help="Results file of an earlier run to compare the p50 latencies with.")
+    e2e_parser.set_defaults(func=benchmark_e2e)
+
+    startup_parser = subparsers.add_parser("startup", help="Import time of the solver and the automator.")
+    startup_parser.add_argument("--solver-budget", type=float, default=50.0, help="Import budget of the solver in ms.")
+    startup_parser.add_argument("--automator-budget", type=float, default=400.0,
+                                help="Import budget of the automator in ms.")
+    startup_parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported.")
+    startup_parser.add_argument("--top", type=int, default=4, help="Number of heaviest packages to show.")
+    startup_parser.set_defaults(func=benchmark_startup)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,148 @@
+import numpy as np
+from sudoku_lazy import lazy_import
+
+cv2 = lazy_import("cv2")
+
+
+def group_positions(values: np.ndarray, tolerance: float) -> list[float]:
+    """Groups sorted positions that are at most tolerance apart
+
+    Args:
+        values (np.ndarray): Positions to group
+        tolerance (float): Largest distance between neighbours in one group
+
+    Returns:
+        list[float]: Smallest position of each group, in ascending order
+    """
+    values = np.sort(values)
+    starts = np.flatnonzero(np.diff(values) > tolerance) + 1
+    return [float(group[0]) for group in np.split(values, starts)]
+
+
+def detect_grid(gray: np.ndarray, threshold: float) -> dict[str, int]:
+    """Finds the 9x9 grid of squares. Squares are the bright connected
+    areas between the grid lines, so every square is one component even when
+    it holds a digit. The most common component size that lines up in 9
+    columns and 9 rows is the square size
+
+    Args:
+        gray (np.ndarray): Grayscale screenshot
+        threshold (float): Gray level that separates squares from lines
+
+    Returns:
+        dict[str, int]: Grid part of the board data
+    """
+    _, _, stats, _ = cv2.connectedComponentsWithStats((gray > threshold).astype(np.uint8), connectivity=4)
+    x, y, width, height = stats[1:, 0], stats[1:, 1], stats[1:, 2], stats[1:, 3]
+
+    # Only roughly square components that do not touch the screen edges
+    candidates = (
+        (width >= 8) & (height >= 8)
+        & (np.abs(width - height) <= 0.2 * np.maximum(width, height))
+        & (x > 0) & (y > 0) & (x + width < gray.shape[1]) & (y + height < gray.shape[0])
+    )
+
+    # Try the most common sizes first, squares usually are the most common one
+    sizes, size_counts = np.unique(width[candidates] // 4, return_counts=True)
+    for size in sizes[np.argsort(-size_counts)]:
+        if size_counts[sizes == size][0] < 9:
+            break
+
+        tolerance = max(2, size)
+        members = candidates & (np.abs(width // 4 - size) <= 1) & (np.abs(height // 4 - size) <= 1)
+        square_width = int(np.median(width[members]))
+        square_height = int(np.median(height[members]))
+        members &= (np.abs(width - square_width) <= 2) & (np.abs(height - square_height) <= 2)
+
+        columns = group_positions(x[members], tolerance)
+        rows = group_positions(y[members], tolerance)
+        if len(columns) < 9 or len(rows) < 9:
+            continue
+
+        # Other same-sized shapes, like buttons, may add extra rows or columns.
+        # Keep the 9 consecutive ones with the most even spacing
+        columns = min((columns[i:i + 9] for i in range(len(columns) - 8)), key=lambda c: np.ptp(np.diff(c)))
+        rows = min((rows[i:i + 9] for i in range(len(rows) - 8)), key=lambda r: np.ptp(np.diff(r)))
+        if np.ptp(np.diff(columns)) > square_width / 2 or np.ptp(np.diff(rows)) > square_height / 2:
+            continue
+
+        in_grid = members & (x >= columns[0] - 2) & (x <= columns[-1] + 2) & (y >= rows[0] - 2) & (y <= rows[-1] + 2)
+        square_width = int(width[in_grid].min())
+        square_height = int(height[in_grid].min())
+        horizontal_gaps = [int(b - a) - square_width for a, b in zip(columns, columns[1:])]
+        vertical_gaps = [int(b - a) - square_height for a, b in zip(rows, rows[1:])]
+
+        return {
+            "board_width": 9 * square_width + sum(horizontal_gaps),
+            "board_height": 9 * square_height + sum(vertical_gaps),
+            "square_x": int(columns[0]),
+            "square_y": int(rows[0]),
+            "square_width": square_width,
+            "square_height": square_height,
+            "horizontal_gaps": horizontal_gaps,
+            "vertical_gaps": vertical_gaps,
+        }
+
+    raise RuntimeError("Could not find the sudoku grid on the screenshot!")
+
+
+def detect_answer_buttons(gray: np.ndarray, threshold: float, grid: dict[str, int]) -> dict[str, int]:
+    """Finds the row of 1 to 9 answer buttons below the grid. The digits on
+    the buttons are dark components of about the same height in one row, so
+    the first such row of at least 9 evenly spaced components is used
+
+    Args:
+        gray (np.ndarray): Grayscale screenshot
+        threshold (float): Gray level that separates digits from the background
+        grid (dict[str, int]): Grid part of the board data, see detect_grid
+
+    Returns:
+        dict[str, int]: Answer button part of the board data
+    """
+    top = grid["square_y"] + grid["board_height"]
+    _, _, stats, _ = cv2.connectedComponentsWithStats((gray[top:] <= threshold).astype(np.uint8))
+    height = stats[1:, 3]
+    center_x = stats[1:, 0] + stats[1:, 2] / 2
+    center_y = stats[1:, 1] + height / 2
+
+    # Glyphs are smaller than a square but not specks
+    glyphs = (height >= grid["square_height"] * 0.15) & (height <= grid["square_height"] * 1.5)
+    for row_y in group_positions(center_y[glyphs], grid["square_height"] * 0.25):
+        in_row = glyphs & (np.abs(center_y - row_y) <= grid["square_height"] * 0.3)
+        in_row &= np.abs(height - np.median(height[in_row])) <= np.median(height[in_row]) * 0.25
+        if np.count_nonzero(in_row) < 9:
+            continue
+
+        xs = np.sort(center_x[in_row])
+        runs = [xs[i:i + 9] for i in range(len(xs) - 8)]
+        best = min(runs, key=lambda run: np.ptp(np.diff(run)))
+        distance = (best[-1] - best[0]) / 8
+        if distance <= 0 or np.ptp(np.diff(best)) > distance * 0.25:
+            continue
+
+        return {
+            "answer_x": int(round(np.mean(best - np.arange(9) * distance))),
+            "answer_y": int(round(top + np.median(center_y[in_row]))),
+            "answer_distance": int(round(distance)),
+        }
+
+    raise RuntimeError("Could not find the answer buttons on the screenshot!")
+
+
+def calibrate(screenshot: np.ndarray) -> dict[str, int]:
+    """Measures the board geometry and the answer buttons on a screenshot
+    without asking the user anything
+
+    Args:
+        screenshot (np.ndarray): RGB or RGBA screenshot with the board visible
+
+    Returns:
+        dict[str, int]: The board data as dictionary, in the same format the
+        interactive calibration produces
+    """
+    gray = cv2.cvtColor(np.ascontiguousarray(screenshot[..., :3]), cv2.COLOR_RGB2GRAY)
+    threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    board_data = detect_grid(gray, threshold)
+    board_data.update(detect_answer_buttons(gray, threshold, board_data))
+    return board_data
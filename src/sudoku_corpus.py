@@ -0,0 +1,378 @@
+from sudoku_solver import METHODS, SudokuSolver
+from collections.abc import Iterable, Iterator
+import argparse
+import itertools
+import numpy as np
+import pathlib
+import time
+
+# Packed files start with this header, followed by one fixed-size record per
+# puzzle. Every square takes 4 bits, two squares per byte, high nibble first
+PACKED_MAGIC = b"SUDOKU4\x00"
+PACKED_RECORD_SIZE = 41
+PACKED_BATCH_SIZE = 4096
+
+
+def parse_line(line: str) -> list[list[int]]:
+    """Parses a puzzle in the common 81 character line format. Anything
+    after the first whitespace or comma, like a rating or a solution, is
+    ignored
+
+    Args:
+        line (str): Digits in row-major order, "0" or "." for empty squares
+
+    Returns:
+        list[list[int]]: Board with zeros for empty squares
+    """
+    text = line.strip().replace(",", " ").split(maxsplit=1)[0]
+    if len(text) != 81:
+        raise ValueError(f"A puzzle needs 81 squares, got {len(text)}: {line.strip()}")
+    text = text.replace(".", "0")
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError(f"Invalid character in puzzle: {line.strip()}")
+    digits = [c - 48 for c in text.encode()]
+    return [digits[y * 9:y * 9 + 9] for y in range(9)]
+
+
+def format_line(board: list[list[int]], empty: str = ".") -> str:
+    """Formats a board in the 81 character line format
+
+    Args:
+        board (list[list[int]]): Board with zeros for empty squares
+        empty (str, optional): Character for empty squares. Defaults to ".".
+
+    Returns:
+        str: The puzzle line, without a line break
+    """
+    return "".join(str(n) if n else empty for row in board for n in row)
+
+
+def read_lines(filename: str) -> Iterator[list[list[int]]]:
+    """Reads a line format corpus one puzzle at a time. Empty lines and
+    lines starting with "#" are skipped
+
+    Args:
+        filename (str): Corpus file
+
+    Yields:
+        list[list[int]]: The boards in file order
+    """
+    with open(filename, "r") as file:
+        for line in file:
+            if line.strip() and not line.startswith("#"):
+                yield parse_line(line)
+
+
+def write_lines(boards: Iterable[list[list[int]]], filename: str, empty: str = ".") -> int:
+    """Writes boards in the line format, one puzzle per line
+
+    Args:
+        boards (Iterable[list[list[int]]]): Boards to write, consumed lazily
+        filename (str): Corpus file
+        empty (str, optional): Character for empty squares. Defaults to ".".
+
+    Returns:
+        int: Number of boards written
+    """
+    count = 0
+    with open(filename, "w") as file:
+        for board in boards:
+            file.write(format_line(board, empty) + "\n")
+            count += 1
+    return count
+
+
+def pack_boards(boards: list[list[list[int]]]) -> bytes:
+    """Packs boards into fixed-size records of 4 bits per square
+
+    Args:
+        boards (list[list[list[int]]]): Boards with zeros for empty squares
+
+    Returns:
+        bytes: PACKED_RECORD_SIZE bytes per board
+    """
+    cells = np.zeros((len(boards), PACKED_RECORD_SIZE * 2), dtype=np.uint8)
+    cells[:, :81] = np.asarray(boards, dtype=np.uint8).reshape(len(boards), 81)
+    if cells.max(initial=0) > 9:
+        raise ValueError("Squares must hold digits from 0 to 9")
+    return ((cells[:, 0::2] << 4) | cells[:, 1::2]).tobytes()
+
+
+def unpack_boards(records: np.ndarray) -> list[list[list[int]]]:
+    """Reverses pack_boards
+
+    Args:
+        records (np.ndarray): Uint8 array with shape (n, PACKED_RECORD_SIZE)
+
+    Returns:
+        list[list[list[int]]]: The boards
+    """
+    cells = np.empty((len(records), PACKED_RECORD_SIZE * 2), dtype=np.uint8)
+    cells[:, 0::2] = records >> 4
+    cells[:, 1::2] = records & 0x0F
+    return cells[:, :81].reshape(len(records), 9, 9).tolist()
+
+
+def write_packed(boards: Iterable[list[list[int]]], filename: str) -> int:
+    """Writes boards in the packed format, batch by batch
+
+    Args:
+        boards (Iterable[list[list[int]]]): Boards to write, consumed lazily
+        filename (str): Corpus file
+
+    Returns:
+        int: Number of boards written
+    """
+    count = 0
+    iterator = iter(boards)
+    with open(filename, "wb") as file:
+        file.write(PACKED_MAGIC)
+        for batch in iter(lambda: list(itertools.islice(iterator, PACKED_BATCH_SIZE)), []):
+            file.write(pack_boards(batch))
+            count += len(batch)
+    return count
+
+
+class PackedCorpus:
+    """A packed corpus file mapped into memory. Puzzles are decoded only
+    when they are read, so files of any size open instantly and iterating
+    over them needs constant memory"""
+
+    def __init__(self, filename: str) -> None:
+        with open(filename, "rb") as file:
+            if file.read(len(PACKED_MAGIC)) != PACKED_MAGIC:
+                raise ValueError(f"{filename} is not a packed sudoku corpus")
+
+        size = pathlib.Path(filename).stat().st_size - len(PACKED_MAGIC)
+        if size % PACKED_RECORD_SIZE:
+            raise ValueError(f"{filename} ends with a partial puzzle")
+
+        self.filename: str = filename
+        self.records: np.ndarray = np.zeros((0, PACKED_RECORD_SIZE), dtype=np.uint8)
+        if size:
+            self.records = np.memmap(
+                filename, dtype=np.uint8, mode="r", offset=len(PACKED_MAGIC),
+                shape=(size // PACKED_RECORD_SIZE, PACKED_RECORD_SIZE)
+            )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __getitem__(self, index: int) -> list[list[int]]:
+        return unpack_boards(self.records[index:index + 1] if index >= 0 else self.records[[index]])[0]
+
+    def __iter__(self) -> Iterator[list[list[int]]]:
+        return self.read()
+
+    def read(self, start: int = 0, stop: int | None = None) -> Iterator[list[list[int]]]:
+        """Reads a range of puzzles, decoding them batch by batch
+
+        Args:
+            start (int, optional): First puzzle to read. Defaults to 0.
+            stop (int | None, optional): Puzzle to stop before, None for the
+            end of the file. Defaults to None.
+
+        Yields:
+            list[list[int]]: The boards in file order
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for batch_start in range(start, stop, PACKED_BATCH_SIZE):
+            yield from unpack_boards(self.records[batch_start:min(batch_start + PACKED_BATCH_SIZE, stop)])
+
+
+def is_packed(filename: str) -> bool:
+    """Checks whether a corpus file is in the packed format
+
+    Args:
+        filename (str): Corpus file
+
+    Returns:
+        bool: True if it starts with PACKED_MAGIC
+    """
+    with open(filename, "rb") as file:
+        return file.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+
+
+def read_corpus(filename: str) -> Iterator[list[list[int]]]:
+    """Reads a corpus in either format one puzzle at a time
+
+    Args:
+        filename (str): Corpus file, packed or line format
+
+    Returns:
+        Iterator[list[list[int]]]: The boards in file order
+    """
+    if is_packed(filename):
+        return iter(PackedCorpus(filename))
+    return read_lines(filename)
+
+
+def write_corpus(boards: Iterable[list[list[int]]], filename: str, packed: bool = False) -> int:
+    """Writes a corpus in either format
+
+    Args:
+        boards (Iterable[list[list[int]]]): Boards to write, consumed lazily
+        filename (str): Corpus file
+        packed (bool, optional): Use the packed format. Defaults to False.
+
+    Returns:
+        int: Number of boards written
+    """
+    if packed:
+        return write_packed(boards, filename)
+    return write_lines(boards, filename)
+
+
+def solve_corpus(
+    filename: str,
+    workers: int | None = None,
+    method: str = "bitmask",
+    max_solutions: int = 2
+) -> Iterator[tuple[list[list[int]], list[list[list[int]]]]]:
+    """Solves every puzzle of a corpus with SudokuSolver.solve_many. The
+    corpus is read while the solver works on earlier puzzles, so memory use
+    does not grow with the corpus size
+
+    Args:
+        filename (str): Corpus file, packed or line format
+        workers (int | None, optional): Worker processes, see solve_many. Defaults to None.
+        method (str, optional): Solving engine, see SudokuSolver.solve. Defaults to "bitmask".
+        max_solutions (int, optional): Solution limit per puzzle. Defaults to 2,
+        which is enough to tell unique puzzles apart.
+
+    Yields:
+        tuple[list[list[int]], list[list[list[int]]]]: Each puzzle with its solutions
+    """
+    puzzles, solver_input = itertools.tee(read_corpus(filename))
+    solutions = SudokuSolver.solve_many(solver_input, workers, method=method, max_solutions=max_solutions)
+    yield from zip(puzzles, solutions)
+
+
+def self_test() -> None:
+    """Checks both formats on small corpora and raises AssertionError if
+    anything does not round-trip"""
+    import tempfile
+
+    puzzles = [
+        "53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79",
+        ".......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...",
+        "9" * 9 + "." * 71 + "9",
+    ]
+    boards = [parse_line(puzzle) for puzzle in puzzles]
+    assert [format_line(board) for board in boards] == puzzles
+    assert parse_line(puzzles[0].replace(".", "0") + "\t3.5 rating") == boards[0]
+    assert parse_line(puzzles[0] + ",solution") == boards[0]
+    for bad in (puzzles[0][:80], puzzles[0][:80] + "x", puzzles[0][:80] + "\u00b2"):
+        try:
+            parse_line(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"Accepted an invalid puzzle: {bad}")
+
+    # Odd cell counts leave half a byte of padding at the end of every record
+    packed = pack_boards(boards)
+    assert len(packed) == len(boards) * PACKED_RECORD_SIZE
+    records = np.frombuffer(packed, dtype=np.uint8).reshape(len(boards), PACKED_RECORD_SIZE)
+    assert unpack_boards(records) == boards
+    assert records[2, 0] == 0x99 and records[2, -1] == 0x90
+    assert pack_boards([]) == b""
+    try:
+        pack_boards([[[10] * 9] * 9])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Packed a square that does not fit in 4 bits")
+
+    with tempfile.TemporaryDirectory() as folder:
+        lines_file, packed_file, empty_file = f"{folder}/c.txt", f"{folder}/c.sdk", f"{folder}/e.sdk"
+        with open(lines_file, "w") as file:
+            file.write("# comment\n\n" + "\n".join(puzzles) + "\n")
+        assert list(read_lines(lines_file)) == boards
+        assert not is_packed(lines_file)
+
+        # Batches smaller than the corpus exercise the batch boundaries
+        many = boards * (PACKED_BATCH_SIZE // len(boards) + 2)
+        assert write_corpus(iter(many), packed_file, packed=True) == len(many)
+        assert is_packed(packed_file)
+        corpus = PackedCorpus(packed_file)
+        assert len(corpus) == len(many) and list(corpus) == many
+        assert list(read_corpus(packed_file)) == many
+        assert corpus[0] == boards[0] and corpus[-1] == many[-1] and corpus[-len(many)] == many[0]
+        edge = PACKED_BATCH_SIZE
+        assert list(corpus.read(edge - 1, edge + 2)) == many[edge - 1:edge + 2]
+        assert list(corpus.read(len(many) - 1, len(many) + 10)) == many[-1:]
+        for index in (len(many), -len(many) - 1):
+            try:
+                corpus[index]
+            except IndexError:
+                continue
+            raise AssertionError(f"Read puzzle {index} of {len(many)}")
+
+        assert write_lines(read_corpus(packed_file), lines_file) == len(many)
+        assert list(read_lines(lines_file)) == many
+
+        assert write_packed([], empty_file) == 0
+        assert len(PackedCorpus(empty_file)) == 0 and list(read_corpus(empty_file)) == []
+
+        # A record cut short and a file that is not a packed corpus are refused
+        with open(empty_file, "ab") as file:
+            file.write(bytes(PACKED_RECORD_SIZE - 1))
+        for filename in (empty_file, lines_file):
+            try:
+                PackedCorpus(filename)
+            except ValueError:
+                continue
+            raise AssertionError(f"Opened {filename} as a packed corpus")
+
+        write_lines(boards, lines_file)
+        results = list(solve_corpus(lines_file, workers=1))
+        assert [puzzle for puzzle, _ in results] == boards
+        assert [len(solutions) for _, solutions in results] == [1, 1, 0]
+        assert results[0][1] == SudokuSolver.solve(boards[0], max_solutions=2)
+    print("Corpus test: line and packed formats round-trip")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts and solves sudoku corpora in the 81 character line format or the packed format."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="Converts a corpus between the two formats.")
+    convert_parser.add_argument("input", help="Corpus to read, the format is detected.")
+    convert_parser.add_argument("output", help="Corpus to write.")
+    convert_parser.add_argument("-p", "--packed", action="store_true", help="Write the packed format.")
+
+    solve_parser = subparsers.add_parser("solve", help="Solves every puzzle of a corpus.")
+    solve_parser.add_argument("input", help="Corpus to read, the format is detected.")
+    solve_parser.add_argument("-o", "--output", help="Write the first solution of every puzzle to this file, "
+                                                     "or an empty line if there is none.")
+    solve_parser.add_argument("-w", "--workers", type=int, help="Worker processes, one per CPU if not given.")
+    solve_parser.add_argument("-sm", "--solver", choices=METHODS, default="bitmask", help="Solving engine.")
+
+    subparsers.add_parser("selftest", help="Checks that both formats round-trip.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    if args.command == "selftest":
+        self_test()
+    elif args.command == "convert":
+        count = write_corpus(read_corpus(args.input), args.output, args.packed)
+        print(f"Wrote {count} puzzle(s) in {round(time.perf_counter() - start_time, 2)} seconds.")
+    else:
+        counts = {"unique": 0, "multiple": 0, "unsolvable": 0}
+        output = open(args.output, "w") if args.output else None
+        try:
+            for puzzle, solutions in solve_corpus(args.input, args.workers, args.solver):
+                counts[("unsolvable", "unique", "multiple")[len(solutions)]] += 1
+                if output:
+                    output.write((format_line(solutions[0]) if solutions else "") + "\n")
+        finally:
+            if output:
+                output.close()
+        total = sum(counts.values())
+        seconds = time.perf_counter() - start_time
+        print(f"Solved {total} puzzle(s) in {round(seconds, 2)} seconds "
+              f"({round(total / seconds if seconds else 0.0, 1)} per second): "
+              f"{counts['unique']} unique, {counts['multiple']} with several solutions, "
+              f"{counts['unsolvable']} unsolvable.")
@@ -0,0 +1,213 @@
+from sudoku_automator import SudokuAutomator
+from sudoku_lazy import lazy_import
+from concurrent.futures import ThreadPoolExecutor
+import pathlib
+import threading
+import time
+import argparse
+import re
+
+Client = lazy_import("ppadb.client", "Client")
+Device = lazy_import("ppadb.device", "Device")
+
+
+class DevicePool:
+    """Keeps one ADB client and one device handle per serial number, so
+    every automator running in the process reuses them instead of creating
+    its own client and listing the devices again. The handles do not hold a
+    connection, ppadb still opens a new socket to the ADB server for every
+    command"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037) -> None:
+        self.client: Client = Client(host=host, port=port)
+        self.devices: dict[str, Device] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+    def refresh(self) -> list[str]:
+        """Lists the attached devices again
+
+        Returns:
+            list[str]: Serial numbers of all attached devices
+        """
+        with self.lock:
+            self.devices = {device.serial: device for device in self.client.devices()}
+            return list(self.devices)
+
+    def get(self, serial: str) -> Device:
+        """Gets the handle of an attached device
+
+        Args:
+            serial (str): Serial number of the device
+
+        Returns:
+            Device: The device
+        """
+        with self.lock:
+            device = self.devices.get(serial)
+        if device is None and serial in self.refresh():
+            device = self.devices[serial]
+        if device is None:
+            raise RuntimeError(f"Device {serial} not found!")
+        return device
+
+
+class DeviceStats:
+    """Throughput of one device"""
+
+    def __init__(self, serial: str) -> None:
+        self.serial: str = serial
+        self.boards: int = 0
+        self.errors: int = 0
+        self.seconds: float = 0.0
+
+    @property
+    def boards_per_minute(self) -> float:
+        return self.boards / self.seconds * 60 if self.seconds > 0 else 0.0
+
+
+def device_board_data_filename(filename: str, serial: str) -> str:
+    """Derives the board data file of one phone from the farm's file, so
+    phones of different models or resolutions never share a geometry
+
+    Args:
+        filename (str): Board data file given to the farm
+        serial (str): Serial number of the phone
+
+    Returns:
+        str: The file with the serial number before its extension, for
+        example "board_data.emulator-5554.json"
+    """
+    path = pathlib.Path(filename)
+    serial = re.sub(r"[^\w.-]", "_", serial)
+    return str(path.with_name(f"{path.stem}.{serial}{path.suffix or '.json'}"))
+
+
+def run_device(
+    pool: DevicePool,
+    serial: str,
+    boards: int,
+    interval: float,
+    automator_options: dict
+) -> DeviceStats:
+    """Solves boards on one device and logs its throughput after each board
+
+    Args:
+        pool (DevicePool): Pool to take the device from
+        serial (str): Serial number of the device
+        boards (int): Number of boards to solve
+        interval (float): Seconds to wait between two boards, for the game
+        to show the next puzzle
+        automator_options (dict): Keyword arguments for SudokuAutomator.
+        Without a profile file, the board data file gets the serial number
+        of the device, see device_board_data_filename
+
+    Returns:
+        DeviceStats: Throughput of the device
+    """
+    stats = DeviceStats(serial)
+    automator_options = dict(automator_options)
+    if automator_options.get("profiles_filename") is None:
+        automator_options["board_data_filename"] = device_board_data_filename(
+            automator_options.get("board_data_filename", "board_data.json"), serial
+        )
+    automator = SudokuAutomator(**automator_options, serial=serial, interactive=False)
+    automator.device = pool.get(serial)
+
+    start_time = time.perf_counter()
+    for i in range(boards):
+        if i and interval:
+            time.sleep(interval)
+        try:
+            automator.solve_board()
+            stats.boards += 1
+        except Exception as e:
+            stats.errors += 1
+            print(f"[{serial}] Board {i + 1} failed: {e}")
+        stats.seconds = time.perf_counter() - start_time
+        print(f"[{serial}] {stats.boards} board(s) in {round(stats.seconds, 2)} seconds "
+              f"({round(stats.boards_per_minute, 2)} boards per minute).")
+    return stats
+
+
+def run_farm(
+    serials: list[str] | None = None,
+    boards: int = 1,
+    interval: float = 0.0,
+    automator_options: dict | None = None,
+    pool: DevicePool | None = None
+) -> list[DeviceStats]:
+    """Runs an automator on every device at the same time, one thread each
+
+    Args:
+        serials (list[str] | None, optional): Devices to use, None for all
+        attached devices. Defaults to None.
+        boards (int, optional): Number of boards to solve per device. Defaults to 1.
+        interval (float, optional): Seconds to wait between two boards. Defaults to 0.0.
+        automator_options (dict | None, optional): Keyword arguments for
+        SudokuAutomator. Defaults to None.
+        pool (DevicePool | None, optional): Device pool to use. Defaults to None.
+
+    Returns:
+        list[DeviceStats]: Throughput of each device
+    """
+    pool = pool or DevicePool()
+    serials = serials or pool.refresh()
+    if not serials:
+        raise RuntimeError("No devices found!")
+
+    with ThreadPoolExecutor(max_workers=len(serials)) as executor:
+        futures = [
+            executor.submit(run_device, pool, serial, boards, interval, automator_options or {})
+            for serial in serials
+        ]
+        results = [future.result() for future in futures]
+
+    total_boards = sum(stats.boards for stats in results)
+    total_rate = sum(stats.boards_per_minute for stats in results)
+    print(f"Solved {total_boards} board(s) on {len(results)} device(s), "
+          f"{round(total_rate, 2)} boards per minute in total.")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs the sudoku automator on several phones at the same time."
+    )
+    parser.add_argument(
+        "-s", "--serial",
+        nargs="+",
+        help="Serial numbers of the phones to use. All attached phones are used if not given."
+    )
+    parser.add_argument(
+        "-n", "--boards",
+        type=int,
+        default=1,
+        help="Number of boards to solve on each phone."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.0,
+        help="Seconds to wait between two boards on a phone."
+    )
+    parser.add_argument(
+        "-bd", "--boarddata",
+        default="board_data.json",
+        help="The board data file name. Every phone uses its own file with its serial number added, for example "
+             "board_data.SERIAL.json. If it is missing, the board is found automatically on the screenshot and "
+             "saved to it. Phones never ask questions, so a board that is not found is an error."
+    )
+    parser.add_argument(
+        "-p", "--profiles",
+        help="A file with the board data of several phones, picked by device model and screen resolution. "
+             "Phones without a profile are calibrated automatically and added."
+    )
+    args = parser.parse_args()
+
+    try:
+        run_farm(args.serial, args.boards, args.interval, {
+            "board_data_filename": args.boarddata,
+            "profiles_filename": args.profiles,
+        })
+    except RuntimeError as re:
+        print(f"A runtime error occured: {re}")
@@ -0,0 +1,308 @@
+from sudoku_lazy import lazy_import
+import re
+import time
+
+Device = lazy_import("ppadb.device", "Device")
+
+INPUT_MODES: tuple[str, ...] = ("tap", "batch", "sendevent")
+INPUT_STRATEGIES: tuple[str, ...] = ("cell_first", "digit_first")
+
+# Rough cost of one tap per input mode in seconds, used by dry runs when
+# there is no measured rate
+ESTIMATED_TAP_SECONDS: dict[str, float] = {
+    "tap": 0.35,
+    "batch": 0.25,
+    "sendevent": 0.02,
+}
+
+# Linux input event codes used to emulate a touch with sendevent
+EV_SYN = 0
+EV_KEY = 1
+EV_ABS = 3
+SYN_REPORT = 0
+BTN_TOUCH = 330
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+
+
+class TapInjector:
+    """Sends taps to the phone with one "input tap" command per tap"""
+
+    def __init__(self, device: Device, tap_delay: float = 0.0) -> None:
+        self.device: Device = device
+        self.tap_delay: float = tap_delay
+
+    def send(self, taps: list[tuple[int, int]]) -> None:
+        """Taps the given screen coordinates in order
+
+        Args:
+            taps (list[tuple[int, int]]): x,y coordinates to tap
+        """
+        for i, (x, y) in enumerate(taps):
+            if i and self.tap_delay:
+                time.sleep(self.tap_delay)
+            self.device.shell(f"input tap {x} {y}")
+
+
+class BatchTapInjector(TapInjector):
+    """Sends many taps in a single shell invocation, which saves an ADB
+    round trip per tap. Commands are split over several invocations only
+    when they would get longer than max_command_length"""
+
+    # Older adbd versions reject shell commands longer than 1024 bytes
+    max_command_length: int = 1024
+
+    def tap_commands(self, x: int, y: int) -> list[str]:
+        """Shell commands for a single tap
+
+        Args:
+            x (int): X coordinate on the screen
+            y (int): Y coordinate on the screen
+
+        Returns:
+            list[str]: Commands that perform the tap
+        """
+        return [f"input tap {x} {y}"]
+
+    def send(self, taps: list[tuple[int, int]]) -> None:
+        """Taps the given screen coordinates in order
+
+        Args:
+            taps (list[tuple[int, int]]): x,y coordinates to tap
+        """
+        separator = f";sleep {self.tap_delay};" if self.tap_delay else ";"
+
+        batch = ""
+        for x, y in taps:
+            tap = ";".join(self.tap_commands(x, y))
+            if batch and len(batch) + len(separator) + len(tap) > self.max_command_length:
+                self.device.shell(batch)
+                batch = ""
+                if self.tap_delay:
+                    time.sleep(self.tap_delay)
+            batch = f"{batch}{separator}{tap}" if batch else tap
+        if batch:
+            self.device.shell(batch)
+
+
+class SendeventTapInjector(BatchTapInjector):
+    """Writes touch events straight to the touchscreen with sendevent. This
+    skips starting the Java based "input" tool on the phone for every tap"""
+
+    def __init__(self, device: Device, tap_delay: float = 0.0) -> None:
+        super().__init__(device, tap_delay)
+        self.touch_device, self.touch_max_x, self.touch_max_y = self.find_touch_device()
+        self.screen_width, self.screen_height = self.get_screen_size()
+
+    def find_touch_device(self) -> tuple[str, int, int]:
+        """Finds the multi-touch screen among the input devices of the phone
+
+        Returns:
+            tuple[str, int, int]: Device path and the maximum x and y values
+            it reports
+        """
+        output = self.device.shell("getevent -p")
+        for block in re.split(r"^add device \d+: ", output, flags=re.MULTILINE)[1:]:
+            path = block.split()[0]
+            max_x = re.search(rf"\b{ABS_MT_POSITION_X:04x}\s*:.*?max (\d+)", block)
+            max_y = re.search(rf"\b{ABS_MT_POSITION_Y:04x}\s*:.*?max (\d+)", block)
+            if max_x and max_y:
+                return path, int(max_x.group(1)), int(max_y.group(1))
+        raise RuntimeError("Could not find a touchscreen for sendevent!")
+
+    def get_screen_size(self) -> tuple[int, int]:
+        """Reads the physical screen size of the phone
+
+        Returns:
+            tuple[int, int]: Width and height in pixels
+        """
+        size = re.search(r"Physical size: (\d+)x(\d+)", self.device.shell("wm size"))
+        if not size:
+            raise RuntimeError("Could not read the screen size!")
+        return int(size.group(1)), int(size.group(2))
+
+    def tap_commands(self, x: int, y: int) -> list[str]:
+        """Shell commands for a single tap
+
+        Args:
+            x (int): X coordinate on the screen
+            y (int): Y coordinate on the screen
+
+        Returns:
+            list[str]: Commands that perform the tap
+        """
+        touch_x = round(x * self.touch_max_x / max(self.screen_width - 1, 1))
+        touch_y = round(y * self.touch_max_y / max(self.screen_height - 1, 1))
+        events = [
+            (EV_ABS, ABS_MT_TRACKING_ID, 0),
+            (EV_ABS, ABS_MT_POSITION_X, touch_x),
+            (EV_ABS, ABS_MT_POSITION_Y, touch_y),
+            (EV_KEY, BTN_TOUCH, 1),
+            (EV_SYN, SYN_REPORT, 0),
+            (EV_ABS, ABS_MT_TRACKING_ID, -1),
+            (EV_KEY, BTN_TOUCH, 0),
+            (EV_SYN, SYN_REPORT, 0),
+        ]
+        return [f"sendevent {self.touch_device} {kind} {code} {value}" for kind, code, value in events]
+
+
+class DryRunInjector(TapInjector):
+    """Counts taps instead of sending them, so input can be planned and
+    timed without a phone"""
+
+    def __init__(self, mode: str = "tap", tap_delay: float = 0.0, taps_per_second: float = 0.0) -> None:
+        super().__init__(None, tap_delay)
+        self.mode: str = mode
+        self.taps_per_second: float = taps_per_second
+        self.tap_count: int = 0
+
+    def send(self, taps: list[tuple[int, int]]) -> None:
+        """Counts the given taps
+
+        Args:
+            taps (list[tuple[int, int]]): x,y coordinates to tap
+        """
+        self.tap_count += len(taps)
+
+    def estimate_seconds(self) -> float:
+        """Estimates how long the counted taps would take on a phone
+
+        Returns:
+            float: Estimated time in seconds
+        """
+        if self.taps_per_second > 0:
+            tap_seconds = 1 / self.taps_per_second
+        else:
+            tap_seconds = ESTIMATED_TAP_SECONDS[self.mode]
+        return self.tap_count * tap_seconds + max(self.tap_count - 1, 0) * self.tap_delay
+
+
+def plan_taps(
+    moves: list[tuple[tuple[int, int], int]],
+    answer_buttons: list[tuple[int, int]],
+    strategy: str = "cell_first"
+) -> list[tuple[int, int]]:
+    """Orders the taps that enter the given answers
+
+    Args:
+        moves (list[tuple[tuple[int, int], int]]): Screen position of each
+        square to fill and the digit that goes into it
+        answer_buttons (list[tuple[int, int]]): Screen positions of the
+        buttons for digits 1 to 9
+        strategy (str, optional): "cell_first" selects a square and then its
+        digit, two taps per square. "digit_first" selects each digit once and
+        then taps all of its squares, for games that support it.
+        Defaults to "cell_first".
+
+    Returns:
+        list[tuple[int, int]]: x,y coordinates to tap in order
+    """
+    taps: list[tuple[int, int]] = []
+    if strategy == "cell_first":
+        for square_pos, answer in moves:
+            taps.append(square_pos)
+            taps.append(answer_buttons[answer - 1])
+    elif strategy == "digit_first":
+        for digit in range(1, 10):
+            squares = [square_pos for square_pos, answer in moves if answer == digit]
+            if squares:
+                taps.append(answer_buttons[digit - 1])
+                taps.extend(squares)
+    else:
+        raise ValueError(f"Unknown input strategy: {strategy}")
+    return taps
+
+
+def create_injector(mode: str, device: Device, tap_delay: float = 0.0) -> TapInjector:
+    """Creates the tap injector for the given input mode
+
+    Args:
+        mode (str): One of INPUT_MODES
+        device (Device): Phone to send the taps to
+        tap_delay (float, optional): Seconds to wait between two taps. Defaults to 0.0.
+
+    Returns:
+        TapInjector: The injector
+    """
+    if mode == "tap":
+        return TapInjector(device, tap_delay)
+    elif mode == "batch":
+        return BatchTapInjector(device, tap_delay)
+    elif mode == "sendevent":
+        return SendeventTapInjector(device, tap_delay)
+    raise ValueError(f"Unknown input mode: {mode}")
+
+
+if __name__ == "__main__":
+    class RecordingDevice:
+        """Stands in for a phone: records shell commands and answers the
+        queries of SendeventTapInjector"""
+
+        def __init__(self) -> None:
+            self.commands: list[str] = []
+
+        def shell(self, command: str) -> str:
+            if command == "getevent -p":
+                return (
+                    "add device 1: /dev/input/event0\n"
+                    "  name:     \"gpio-keys\"\n"
+                    "add device 2: /dev/input/event3\n"
+                    "  name:     \"touchscreen\"\n"
+                    "  events:\n"
+                    "    ABS (0003): 0035  : value 0, min 0, max 4095, fuzz 0, flat 0, resolution 0\n"
+                    "                0036  : value 0, min 0, max 8191, fuzz 0, flat 0, resolution 0\n"
+                )
+            if command == "wm size":
+                return "Physical size: 1080x2400\n"
+            self.commands.append(command)
+            return ""
+
+    taps = [(x, y) for y in range(100, 1000, 50) for x in range(100, 1000, 90)]
+
+    # Batches stay below the command length limit and keep the tap order
+    for tap_delay in (0.0, 0.001):
+        device = RecordingDevice()
+        BatchTapInjector(device, tap_delay).send(taps)
+        assert len(device.commands) > 1
+        assert all(len(command) <= BatchTapInjector.max_command_length for command in device.commands)
+        sent = [part for command in device.commands for part in command.split(";") if not part.startswith("sleep")]
+        assert sent == [f"input tap {x} {y}" for x, y in taps]
+
+    # Sendevent finds the touchscreen and scales screen pixels to its axis range
+    device = RecordingDevice()
+    injector = SendeventTapInjector(device)
+    assert (injector.touch_device, injector.touch_max_x, injector.touch_max_y) == ("/dev/input/event3", 4095, 8191)
+    injector.send([(0, 0), (1079, 2399), (540, 1200)])
+    positions = [
+        int(part.split()[-1]) for command in device.commands for part in command.split(";")
+        if part.split()[3] in (str(ABS_MT_POSITION_X), str(ABS_MT_POSITION_Y))
+    ]
+    assert positions == [0, 0, 4095, 8191, 2049, 4097]
+    assert all(part.startswith("sendevent /dev/input/event3 ") for part in device.commands[0].split(";"))
+
+    # Digit first taps the same squares as cell first, after one tap on each digit they need
+    answer_buttons = [(60 + 120 * i, 1500) for i in range(9)]
+    moves = [
+        ((60 + 120 * x, 300 + 120 * y), (3 * x + y) % 9 + 1)
+        for y in range(9) for x in range(9) if (x + y) % 2 and (3 * x + y) % 9 != 6
+    ]
+    cell_first = plan_taps(moves, answer_buttons, "cell_first")
+    digit_first = plan_taps(moves, answer_buttons, "digit_first")
+    assert cell_first[::2] == [square_pos for square_pos, _ in moves]
+    assert sorted(tap for tap in digit_first if tap not in answer_buttons) == sorted(cell_first[::2])
+    assert [tap for tap in digit_first if tap in answer_buttons] == [answer_buttons[i] for i in range(9) if i != 6]
+    digit = None
+    for tap in digit_first:
+        if tap in answer_buttons:
+            digit = answer_buttons.index(tap) + 1
+        else:
+            assert (tap, digit) in moves
+    assert len(digit_first) == len(moves) + 8 < len(cell_first)
+
+    # Dry runs count the taps and estimate their time
+    dry_run = DryRunInjector("tap", 0.1)
+    dry_run.send(taps)
+    assert dry_run.tap_count == len(taps)
+    assert abs(dry_run.estimate_seconds() - len(taps) * ESTIMATED_TAP_SECONDS["tap"] - (len(taps) - 1) * 0.1) < 1e-9
+    print("Input test: batches, sendevent scaling, tap plans and dry runs agree")
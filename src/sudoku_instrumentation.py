@@ -0,0 +1,287 @@
+import contextlib
+import cProfile
+import json
+import pathlib
+import threading
+import time
+from collections.abc import Iterable, Iterator
+
+
+class MemorySink:
+    """Keeps every record in a list, for tests and for reading the results
+    from code"""
+
+    def __init__(self) -> None:
+        self.records: list[dict] = []
+        self.lock: threading.Lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        """Stores a record
+
+        Args:
+            record (dict): Span or counters record
+        """
+        with self.lock:
+            self.records.append(record)
+
+    def spans(self, name: str | None = None) -> list[dict]:
+        """Gets the span records
+
+        Args:
+            name (str | None, optional): Only spans with this name, None for
+            all spans. Defaults to None.
+
+        Returns:
+            list[dict]: Span records in the order they ended
+        """
+        with self.lock:
+            return [r for r in self.records if r["type"] == "span" and name in (None, r["name"])]
+
+    def counters(self) -> dict[str, int]:
+        """Adds up every counters record
+
+        Returns:
+            dict[str, int]: Total of each counter
+        """
+        totals: dict[str, int] = {}
+        with self.lock:
+            for record in self.records:
+                if record["type"] == "counters":
+                    for name, value in record["counters"].items():
+                        totals[name] = totals.get(name, 0) + value
+        return totals
+
+
+class JsonLinesSink:
+    """Appends every record to a file as one line of JSON"""
+
+    def __init__(self, filename: str) -> None:
+        self.file = open(filename, "a")
+        self.lock: threading.Lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        """Writes a record
+
+        Args:
+            record (dict): Span or counters record
+        """
+        line = json.dumps(record)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self) -> None:
+        """Closes the file"""
+        self.file.close()
+
+
+class Instrumentation:
+    """Collects named spans timed with perf_counter and named counters, and
+    passes them on to sinks. A sink is any object with a write(record)
+    method, see MemorySink and JsonLinesSink. Spans can also be profiled
+    with cProfile"""
+
+    def __init__(
+        self,
+        sinks: Iterable | None = None,
+        profile: Iterable[str] = (),
+        profile_dir: str = "profiles"
+    ) -> None:
+        """
+        Args:
+            sinks (Iterable | None, optional): Sinks that receive every record. Defaults to None.
+            profile (Iterable[str], optional): Names of the spans to profile,
+            "all" profiles every span. Defaults to ().
+            profile_dir (str, optional): Folder the profiles are saved to as
+            "<span>-<n>.prof" files, readable with pstats or snakeviz.
+            Defaults to "profiles".
+        """
+        self.sinks: list = list(sinks or [])
+        self.profile: set[str] = set(profile)
+        self.profile_dir: pathlib.Path = pathlib.Path(profile_dir)
+        self.counters: dict[str, int] = {}
+        self.profile_count: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        """Times the code in a with block and writes a span record to the
+        sinks when it ends, also when it raises
+
+        Args:
+            name (str): Name of the span, usually the pipeline stage
+            **attributes: Extra fields for the record
+
+        Yields:
+            dict: The record. "seconds" is filled in once the block ends
+        """
+        record = {"type": "span", "name": name, "time": time.time(), **attributes}
+        profiler = None
+        if name in self.profile or "all" in self.profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already running, for example an enclosing span
+                profiler = None
+
+        start_time = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = repr(e)
+            raise
+        finally:
+            record["seconds"] = time.perf_counter() - start_time
+            if profiler is not None:
+                profiler.disable()
+                record["profile"] = self.save_profile(profiler, name)
+            self.emit(record)
+
+    def save_profile(self, profiler: cProfile.Profile, name: str) -> str:
+        """Saves the profile of a span
+
+        Args:
+            profiler (cProfile.Profile): Profiler of the span
+            name (str): Name of the span
+
+        Returns:
+            str: Profile filename
+        """
+        with self.lock:
+            self.profile_count += 1
+            filename = self.profile_dir / f"{name}-{self.profile_count}.prof"
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(filename)
+        return str(filename)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Adds to a counter
+
+        Args:
+            name (str): Name of the counter
+            value (int, optional): Amount to add. Defaults to 1.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def count_all(self, counters: dict[str, int], prefix: str = "") -> None:
+        """Adds to several counters at once
+
+        Args:
+            counters (dict[str, int]): Amount to add to each counter
+            prefix (str, optional): Prefix for every counter name, for
+            example "solver.". Defaults to "".
+        """
+        with self.lock:
+            for name, value in counters.items():
+                self.counters[prefix + name] = self.counters.get(prefix + name, 0) + value
+
+    def flush(self, name: str = "counters", **attributes) -> dict[str, int]:
+        """Writes the counters to the sinks as one record and starts them
+        again from zero. Nothing is written if no counter changed
+
+        Args:
+            name (str, optional): Name of the record. Defaults to "counters".
+            **attributes: Extra fields for the record
+
+        Returns:
+            dict[str, int]: The counters that were written
+        """
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        if counters:
+            self.emit({"type": "counters", "name": name, "time": time.time(), "counters": counters, **attributes})
+        return counters
+
+    def emit(self, record: dict) -> None:
+        """Passes a record to every sink
+
+        Args:
+            record (dict): Span or counters record
+        """
+        for sink in self.sinks:
+            sink.write(record)
+
+
+if __name__ == "__main__":
+    import tempfile
+    from sudoku_automator import SudokuAutomator
+    from sudoku_benchmark import FakeDevice, synthetic_screenshot
+    from sudoku_corpus import parse_line
+    import numpy as np
+
+    sink = MemorySink()
+    instrumentation = Instrumentation([sink])
+
+    # Nested spans end inner first, and the outer one covers the inner one
+    with instrumentation.span("outer", board=1) as outer:
+        with instrumentation.span("inner"):
+            time.sleep(0.01)
+    inner_record, outer_record = sink.spans()
+    assert [inner_record["name"], outer_record["name"]] == ["inner", "outer"]
+    assert outer_record is outer and outer["board"] == 1
+    assert outer["seconds"] >= inner_record["seconds"] >= 0.01
+    assert sink.spans("inner") == [inner_record]
+
+    # A span that raises is still written, with the error, and the error goes on
+    try:
+        with instrumentation.span("failing"):
+            raise KeyError("missing")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("The span swallowed the error")
+    assert sink.spans("failing")[0]["error"] == repr(KeyError("missing"))
+    assert "seconds" in sink.spans("failing")[0]
+
+    # Counters add up, take a prefix and start from zero after a flush
+    instrumentation.count("squares", 81)
+    instrumentation.count("squares")
+    instrumentation.count_all({"nodes": 3, "backtracks": 1}, "solver.")
+    instrumentation.count_all({"nodes": 2}, "solver.")
+    assert instrumentation.flush("board", board=1) == {"squares": 82, "solver.nodes": 5, "solver.backtracks": 1}
+    assert instrumentation.flush("board") == {}
+    assert [r["name"] for r in sink.records if r["type"] == "counters"] == ["board"]
+    assert sink.records[-1]["board"] == 1
+    instrumentation.count("squares", 8)
+    instrumentation.flush()
+    assert sink.counters() == {"squares": 90, "solver.nodes": 5, "solver.backtracks": 1}
+
+    # Records survive the trip through a JSON lines file
+    with tempfile.TemporaryDirectory() as folder:
+        filename = f"{folder}/trace.jsonl"
+        file_sink = JsonLinesSink(filename)
+        file_instrumentation = Instrumentation([file_sink], profile=["profiled"], profile_dir=folder)
+        with file_instrumentation.span("profiled"):
+            sum(range(1000))
+        file_instrumentation.count("taps", 3)
+        file_instrumentation.flush()
+        file_sink.close()
+        with open(filename, "r") as file:
+            records = [json.loads(line) for line in file]
+        assert [r["type"] for r in records] == ["span", "counters"]
+        assert pathlib.Path(records[0]["profile"]).exists()
+        assert records[1]["counters"] == {"taps": 3}
+
+    # A whole board through solve_board, with the phone replaced by FakeDevice
+    board = parse_line("53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79")
+    sink = MemorySink()
+    automator = SudokuAutomator(instrumentation=Instrumentation([sink]), cache_mode="exact")
+    screenshot, board_data = synthetic_screenshot(automator, board, 40, np.random.default_rng(0))
+    automator.board_data = board_data
+    automator.device = FakeDevice(screenshot)
+    automator.solve_board()
+
+    empty = sum(n == 0 for row in board for n in row)
+    assert [r["name"] for r in sink.spans()] == ["capture", "extract", "recognize", "empty_squares", "solve", "input"]
+    assert all(r["seconds"] >= 0 and "error" not in r for r in sink.spans())
+    assert len([c for c in automator.device.commands if c.startswith("input tap")]) == 2 * empty
+    counters = sink.counters()
+    assert counters["recognition.squares"] == 81
+    assert counters["recognition.cache_hits"] + counters["recognition.cache_misses"] == 81
+    # Identical squares are classified once, all empty squares look the same
+    assert 0 < counters["recognition.classified"] <= 81 - empty + 1
+    assert counters["solver.nodes"] >= 1 and counters["solver.propagations"] > 0
+    assert [r["name"] for r in sink.records if r["type"] == "counters"] == ["board"]
+    print("Instrumentation test: spans, counters, sinks and an instrumented board agree")
@@ -0,0 +1,48 @@
+import importlib
+
+
+class _LazyModule:
+    """Stands in for a module, or for one attribute of a module, and imports
+    it the first time it is used. Importing cv2, sklearn or ppadb costs up to
+    seconds, so code paths that never reach them should not pay for them"""
+
+    def __init__(self, module: str, attribute: str | None = None) -> None:
+        self._module: str = module
+        self._attribute: str | None = attribute
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            if self._attribute is not None:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        name = self._module if self._attribute is None else f"{self._module}.{self._attribute}"
+        state = "loaded" if self._target is not None else "not loaded"
+        return f"<lazy {name}, {state}>"
+
+
+def lazy_import(module: str, attribute: str | None = None) -> _LazyModule:
+    """Imports a module, or an attribute of it, on first use. Works for
+    modules, functions and classes that are called or have their attributes
+    read. Anything that needs the real object, like isinstance checks, has to
+    import it normally
+
+    Args:
+        module (str): Name of the module, for example "sklearn.cluster"
+        attribute (str | None, optional): Name to take from the module, for
+        example "KMeans". Defaults to None.
+
+    Returns:
+        _LazyModule: Proxy for the module or attribute
+    """
+    return _LazyModule(module, attribute)
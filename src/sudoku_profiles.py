@@ -0,0 +1,152 @@
+import json
+import os
+import pathlib
+import tempfile
+import threading
+
+
+def write_json(filename: str, data: dict, indent: int | None = None) -> None:
+    """Writes a JSON file next to its destination and then moves it over
+    it, so a reader in another thread or process never sees a partly
+    written file
+
+    Args:
+        filename (str): Destination file
+        data (dict): Data to write
+        indent (int | None, optional): Indentation of the JSON. Defaults to None.
+    """
+    path = pathlib.Path(filename).resolve()
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, suffix=".tmp", delete=False) as file:
+        temporary = file.name
+        try:
+            json.dump(data, file, indent=indent)
+        except BaseException:
+            file.close()
+            os.remove(temporary)
+            raise
+    os.replace(temporary, path)
+
+
+class BoardProfileStore:
+    """Board data of several phones in one JSON file. Each profile is keyed
+    by the device model and the screen resolution, so a new phone of a known
+    model and resolution needs no calibration. The file is read once per
+    process and looked up in memory afterwards"""
+
+    stores: dict[str, "BoardProfileStore"] = {}
+    stores_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, filename: str) -> None:
+        self.filename: str = filename
+        self.profiles: dict[str, dict] = {}
+        self.resolutions: dict[str, str] = {}
+        self.lock: threading.Lock = threading.Lock()
+
+        if pathlib.Path(filename).exists():
+            with open(filename, "r") as file:
+                for key, board_data in json.load(file).items():
+                    self.add(key, board_data)
+
+    @classmethod
+    def open(cls, filename: str) -> "BoardProfileStore":
+        """Gets the store of a profile file, reading the file only the first
+        time it is opened in this process
+
+        Args:
+            filename (str): Profile file
+
+        Returns:
+            BoardProfileStore: The store, shared by every caller
+        """
+        path = str(pathlib.Path(filename).resolve())
+        with cls.stores_lock:
+            if path not in cls.stores:
+                cls.stores[path] = cls(filename)
+            return cls.stores[path]
+
+    @staticmethod
+    def profile_key(model: str, width: int, height: int) -> str:
+        """Builds the key of a profile
+
+        Args:
+            model (str): Device model, as reported by "getprop ro.product.model"
+            width (int): Screen width in pixels
+            height (int): Screen height in pixels
+
+        Returns:
+            str: Key in the form "model@widthxheight"
+        """
+        return f"{model}@{width}x{height}"
+
+    def add(self, key: str, board_data: dict) -> None:
+        """Adds a profile to the in-memory index
+
+        Args:
+            key (str): Profile key, see profile_key
+            board_data (dict): Board data of the profile
+        """
+        self.profiles[key] = board_data
+        self.resolutions.setdefault(key.rpartition("@")[2], key)
+
+    def lookup(self, model: str, width: int, height: int) -> dict | None:
+        """Finds the board data for a phone. Profiles of other models with
+        the same resolution are used when the model itself is unknown, since
+        the game lays out the board the same way on them
+
+        Args:
+            model (str): Device model
+            width (int): Screen width in pixels
+            height (int): Screen height in pixels
+
+        Returns:
+            dict | None: Copy of the board data, None if no profile fits
+        """
+        with self.lock:
+            board_data = self.profiles.get(self.profile_key(model, width, height))
+            if board_data is None:
+                key = self.resolutions.get(f"{width}x{height}")
+                board_data = self.profiles.get(key)
+            return None if board_data is None else dict(board_data)
+
+    def save_profile(self, model: str, width: int, height: int, board_data: dict) -> None:
+        """Adds or replaces a profile and writes all profiles to the file
+
+        Args:
+            model (str): Device model
+            width (int): Screen width in pixels
+            height (int): Screen height in pixels
+            board_data (dict): Board data of the phone
+        """
+        with self.lock:
+            self.add(self.profile_key(model, width, height), dict(board_data))
+            write_json(self.filename, self.profiles, indent=4)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, "profiles.json")
+        store = BoardProfileStore(filename)
+        assert store.lookup("Pixel 7", 1080, 2400) is None
+        store.save_profile("Pixel 7", 1080, 2400, {"square_x": 40})
+        store.save_profile("Galaxy S21", 1080, 2400, {"square_x": 52})
+        store.save_profile("Galaxy S21", 1440, 3200, {"square_x": 70})
+
+        # The exact model wins over another model with the same resolution
+        assert store.lookup("Pixel 7", 1080, 2400) == {"square_x": 40}
+        assert store.lookup("Galaxy S21", 1080, 2400) == {"square_x": 52}
+        assert store.lookup("Galaxy S21", 1440, 3200) == {"square_x": 70}
+
+        # Unknown models get the first profile of their resolution, never one of another resolution
+        assert store.lookup("Moto G", 1080, 2400) == {"square_x": 40}
+        assert store.lookup("Moto G", 1440, 3200) == {"square_x": 70}
+        assert store.lookup("Moto G", 720, 1600) is None
+        assert store.lookup("Pixel 7", 2400, 1080) is None
+
+        # Lookups return copies, and the file holds every profile
+        store.lookup("Pixel 7", 1080, 2400)["square_x"] = 0
+        assert store.lookup("Pixel 7", 1080, 2400) == {"square_x": 40}
+        reread = BoardProfileStore(filename)
+        assert reread.profiles == store.profiles
+        assert reread.lookup("Moto G", 1080, 2400) == store.lookup("Moto G", 1080, 2400)
+        assert os.listdir(folder) == ["profiles.json"]
+    print("Profile test: exact matches, resolution fallbacks and misses agree")
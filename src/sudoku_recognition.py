@@ -0,0 +1,980 @@
+from collections import OrderedDict
+import hashlib
+import json
+import numpy as np
+import os
+import pathlib
+from sudoku_lazy import lazy_import
+import tempfile
+import threading
+import warnings
+import zipfile
+warnings.filterwarnings('ignore', message='Number of distinct clusters*')
+
+cv2 = lazy_import("cv2")
+KMeans = lazy_import("sklearn.cluster", "KMeans")
+ssim = lazy_import("skimage.metrics", "structural_similarity")
+futures = lazy_import("concurrent.futures")
+multiprocessing = lazy_import("multiprocessing")
+shared_memory = lazy_import("multiprocessing.shared_memory")
+resource_tracker = lazy_import("multiprocessing.resource_tracker")
+
+BINARIZATIONS: tuple[str, ...] = ("kmeans", "otsu", "threshold")
+RECOGNIZERS: tuple[str, ...] = ("ssim", "ncc")
+CACHE_MODES: tuple[str, ...] = ("off", "exact", "perceptual")
+
+BACKGROUND_GRAY = 255
+DIGIT_GRAY = 0
+
+TEMPLATE_FOLDER = pathlib.Path(__file__).resolve().parent / "number_squares"
+TEMPLATE_CACHE_NAME = "templates.npz"
+
+
+def to_black_and_white(background: np.ndarray) -> np.ndarray:
+    """Turns a background mask into the black digit on white image the
+    number templates use
+
+    Args:
+        background (np.ndarray): Boolean mask, True for background pixels
+
+    Returns:
+        np.ndarray: Grayscale image
+    """
+    return np.where(background, BACKGROUND_GRAY, DIGIT_GRAY).astype(np.uint8)
+
+
+def binarize_kmeans(rgb: np.ndarray) -> np.ndarray:
+    """Splits the cell colours into two clusters and treats the bigger one
+    as the background
+
+    Args:
+        rgb (np.ndarray): RGB cell image
+
+    Returns:
+        np.ndarray: Black digit on white grayscale image
+    """
+    pixels = rgb.reshape(-1, 3)
+    kmeans = KMeans(n_clusters=2, n_init='auto', random_state=0)
+    kmeans.fit(pixels)
+
+    labels = kmeans.labels_
+    unique_labels, counts = np.unique(labels, return_counts=True)
+    primary_number = unique_labels[np.argmax(counts)]
+
+    return to_black_and_white(labels.reshape(rgb.shape[:2]) == primary_number)
+
+
+def binarize_threshold(rgb: np.ndarray, threshold: float | None = None) -> np.ndarray | None:
+    """Splits the cell into bright and dark pixels at the given threshold, or
+    at the Otsu threshold of the cell if none is given, and treats the bigger
+    side as the background
+
+    Args:
+        rgb (np.ndarray): RGB cell image
+        threshold (float | None, optional): Gray level to split at. Defaults to None.
+
+    Returns:
+        np.ndarray | None: Black digit on white grayscale image, None if every
+        pixel ended up on the same side
+    """
+    gray = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2GRAY)
+    if threshold is None:
+        threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    bright = gray > threshold
+    bright_count = np.count_nonzero(bright)
+    if bright_count == 0 or bright_count == bright.size:
+        return None
+
+    if bright_count * 2 >= bright.size:
+        return to_black_and_white(bright)
+    return to_black_and_white(~bright)
+
+
+def board_threshold(rgb: np.ndarray) -> float:
+    """Computes one Otsu threshold for a whole board, so cells can be
+    binarized without looking at their histograms one by one
+
+    Args:
+        rgb (np.ndarray): RGB image of the board
+
+    Returns:
+        float: Gray level that separates the digits from the background
+    """
+    gray = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2GRAY)
+    threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return threshold
+
+
+def binarize(rgb: np.ndarray, method: str = "kmeans", threshold: float | None = None) -> np.ndarray:
+    """Turns a non-empty cell into a black digit on white image with the
+    given strategy. Thresholding falls back to KMeans when it can not split
+    the cell
+
+    Args:
+        rgb (np.ndarray): RGB cell image
+        method (str, optional): One of BINARIZATIONS. "otsu" computes a
+        threshold per cell, "threshold" uses the given board-wide threshold.
+        Defaults to "kmeans".
+        threshold (float | None, optional): Board-wide threshold, see
+        board_threshold. Without it "threshold" behaves like "otsu".
+        Defaults to None.
+
+    Returns:
+        np.ndarray: Black digit on white grayscale image
+    """
+    if method == "kmeans":
+        return binarize_kmeans(rgb)
+    elif method == "otsu":
+        result = binarize_threshold(rgb)
+    elif method == "threshold":
+        result = binarize_threshold(rgb, threshold)
+    else:
+        raise ValueError(f"Unknown binarization method: {method}")
+
+    if result is None:
+        return binarize_kmeans(rgb)
+    return result
+
+
+def empty_mask(rgb: np.ndarray) -> np.ndarray:
+    """Finds the empty squares without recognizing them. A square is empty
+    when every pixel has the colour of its first pixel
+
+    Args:
+        rgb (np.ndarray): RGB square images with shape (n, h, w, 3)
+
+    Returns:
+        np.ndarray: True for every empty square
+    """
+    return (rgb == rgb[:, :1, :1]).all(axis=(1, 2, 3))
+
+
+def normalize_rows(images: np.ndarray) -> np.ndarray:
+    """Flattens images into zero mean, unit length rows, so the dot product
+    of two rows is their normalized cross-correlation
+
+    Args:
+        images (np.ndarray): Stack of images with shape (n, h, w)
+
+    Returns:
+        np.ndarray: Float32 array with shape (n, h * w)
+    """
+    rows = images.reshape(images.shape[0], -1).astype(np.float32)
+    rows -= rows.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return rows / norms
+
+
+class TemplateMatcher:
+    """Recognizes a whole board at once by scoring every cell against every
+    number template with normalized cross-correlation in one matrix product"""
+
+    def __init__(self, templates: list[np.ndarray]) -> None:
+        self.shape: tuple[int, int] = templates[0].shape
+        self.images: np.ndarray = np.stack(templates)
+        self.templates: np.ndarray = normalize_rows(self.images)
+
+    def scaled(self, height: int, width: int) -> "TemplateMatcher":
+        """Creates a matcher for cells of another size, so the cells can be
+        matched as they are instead of being resized one by one. The scaled
+        templates are thresholded again to stay black and white like the
+        binarized cells
+
+        Args:
+            height (int): Cell height in pixels
+            width (int): Cell width in pixels
+
+        Returns:
+            TemplateMatcher: Matcher with templates of the given size
+        """
+        if (height, width) == self.shape:
+            return self
+        templates = []
+        for image in self.images:
+            scaled = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            templates.append(np.where(scaled > 127, BACKGROUND_GRAY, DIGIT_GRAY).astype(np.uint8))
+        return TemplateMatcher(templates)
+
+    def scores(self, cells: np.ndarray) -> np.ndarray:
+        """Scores binarized cells against the templates
+
+        Args:
+            cells (np.ndarray): Black digit on white cells with shape (n, h, w),
+            already resized to the template shape
+
+        Returns:
+            np.ndarray: Correlation scores with shape (n, 9), column i is digit i + 1
+        """
+        return normalize_rows(cells) @ self.templates.T
+
+    def recognize(
+        self,
+        squares: list[np.ndarray],
+        binarization: str = "otsu",
+        threshold: float | None = None
+    ) -> list[list[int]]:
+        """Converts the 81 square images of a board into a sudoku board
+
+        Args:
+            squares (list[np.ndarray]): RGB or RGBA square images in row-major order
+            binarization (str, optional): Binarization strategy, see binarize.
+            Defaults to "otsu".
+            threshold (float | None, optional): Board-wide threshold, see binarize.
+            Defaults to None.
+
+        Returns:
+            list[list[int]]: Board with zeros for empty squares
+        """
+        digits = self.recognize_cells(squares, binarization, threshold)
+        return [digits[y * 9:y * 9 + 9] for y in range(9)]
+
+    def recognize_cells(
+        self,
+        squares: list[np.ndarray],
+        binarization: str = "otsu",
+        threshold: float | None = None
+    ) -> list[int]:
+        """Recognizes any number of same-sized square images in one pass
+
+        Args:
+            squares (list[np.ndarray]): RGB or RGBA square images
+            binarization (str, optional): Binarization strategy, see binarize.
+            Defaults to "otsu".
+            threshold (float | None, optional): Board-wide threshold, see binarize.
+            Defaults to None.
+
+        Returns:
+            list[int]: The digit of each square, 0 for empty squares
+        """
+        scores = self.cell_scores(squares, binarization, threshold)
+        digits = np.zeros(len(squares), dtype=int)
+        filled = ~np.isnan(scores[:, 0])
+        digits[filled] = scores[filled].argmax(axis=1) + 1
+        return digits.tolist()
+
+    def cell_scores(
+        self,
+        squares: list[np.ndarray],
+        binarization: str = "otsu",
+        threshold: float | None = None
+    ) -> np.ndarray:
+        """Scores any number of same-sized square images against the
+        templates in one pass
+
+        Args:
+            squares (list[np.ndarray]): RGB or RGBA square images
+            binarization (str, optional): Binarization strategy, see binarize.
+            Defaults to "otsu".
+            threshold (float | None, optional): Board-wide threshold, see binarize.
+            Defaults to None.
+
+        Returns:
+            np.ndarray: Scores with shape (n, 9), column i is digit i + 1. Rows
+            of empty squares are NaN
+        """
+        scores = np.full((len(squares), 9), np.nan, dtype=np.float32)
+        if not squares:
+            return scores
+        rgb = np.stack([np.asarray(square)[..., :3] for square in squares])
+        filled = np.flatnonzero(~empty_mask(rgb))
+        if len(filled):
+            height, width = self.shape
+            cells = np.empty((len(filled), height, width), dtype=np.uint8)
+            for n, i in enumerate(filled):
+                cell = binarize(rgb[i], binarization, threshold)
+                if cell.shape != self.shape:
+                    cell = cv2.resize(cell, (width, height))
+                cells[n] = cell
+            scores[filled] = self.scores(cells)
+
+        return scores
+
+
+class TemplateBank:
+    """The number templates of one folder, loaded once per process and
+    shared by every automator. Keeps a TemplateMatcher per cell size, so
+    templates are scaled and normalized once per size. The templates are
+    black and white, so the bank is cached as packed bits next to the PNGs
+    and later starts skip decoding them"""
+
+    banks: dict[str, "TemplateBank"] = {}
+    banks_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, images: np.ndarray) -> None:
+        """
+        Args:
+            images (np.ndarray): Black digit on white templates for digits
+            1 to 9 with shape (9, h, w)
+        """
+        self.images: np.ndarray = images
+        # Identifies the template set, for example in recognition cache keys
+        self.fingerprint: str = hashlib.blake2b(np.ascontiguousarray(images).data, digest_size=8).hexdigest()
+        self.matcher: TemplateMatcher = TemplateMatcher(list(images))
+        self.matchers: dict[tuple[int, int], TemplateMatcher] = {self.matcher.shape: self.matcher}
+        self.lock: threading.Lock = threading.Lock()
+        self.filename: pathlib.Path = None
+        # Sizes were scaled since the cache was read or written
+        self.changed: bool = False
+
+    @classmethod
+    def load(cls, folder: pathlib.Path | str = TEMPLATE_FOLDER) -> "TemplateBank":
+        """Gets the bank of a template folder. The first call in a process
+        reads the binary cache if it is newer than the PNGs, and decodes the
+        PNGs and writes the cache otherwise
+
+        Args:
+            folder (pathlib.Path | str, optional): Folder with the templates
+            1.png to 9.png. Defaults to TEMPLATE_FOLDER.
+
+        Returns:
+            TemplateBank: The bank, shared by every caller
+        """
+        folder = pathlib.Path(folder).resolve()
+        with cls.banks_lock:
+            bank = cls.banks.get(str(folder))
+            if bank is None:
+                bank = cls.from_cache(folder)
+                if bank is None:
+                    bank = cls.from_folder(folder)
+                    bank.changed = True
+                bank.filename = folder / TEMPLATE_CACHE_NAME
+                bank.persist()
+                cls.banks[str(folder)] = bank
+            return bank
+
+    @classmethod
+    def from_folder(cls, folder: pathlib.Path) -> "TemplateBank":
+        """Decodes the template PNGs
+
+        Args:
+            folder (pathlib.Path): Folder with the templates 1.png to 9.png
+
+        Returns:
+            TemplateBank: The bank
+        """
+        images = []
+        for i in range(1, 10):
+            image = cv2.imread(str(folder / f"{i}.png"), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                raise RuntimeError(f"Could not read the number template {folder / f'{i}.png'}!")
+            images.append(image)
+        return cls(np.stack(images))
+
+    @classmethod
+    def from_cache(cls, folder: pathlib.Path) -> "TemplateBank | None":
+        """Reads the binary cache of a template folder, together with every
+        cell size that was scaled to before it was saved
+
+        Args:
+            folder (pathlib.Path): Folder with the templates and the cache
+
+        Returns:
+            TemplateBank | None: The bank, None if there is no cache, a
+            template changed after it was written or the cache is damaged
+        """
+        cache = folder / TEMPLATE_CACHE_NAME
+        pngs = [folder / f"{i}.png" for i in range(1, 10)]
+        try:
+            if not cache.exists() or any(png.stat().st_mtime > cache.stat().st_mtime for png in pngs if png.exists()):
+                return None
+
+            with np.load(cache) as data:
+                stacks = {}
+                for name in data.files:
+                    kind, size = name.split("_")
+                    height, width = (int(n) for n in size.split("x"))
+                    stacks[kind, (height, width)] = unpack_templates(data[name], width)
+        except (zipfile.BadZipFile, ValueError, KeyError, OSError, EOFError):
+            # The PNGs are decoded again and the cache rewritten
+            return None
+
+        base = next((images for (kind, _), images in stacks.items() if kind == "base"), None)
+        if base is None or base.shape[0] != 9:
+            return None
+        bank = cls(base)
+        for (kind, size), images in stacks.items():
+            if kind == "scaled":
+                bank.matchers[size] = TemplateMatcher(list(images))
+        return bank
+
+    def save(self, filename: pathlib.Path | str) -> None:
+        """Writes the templates and every scaled size as packed bits. The
+        file is written next to the cache and then moved over it, so readers
+        never see a partly written cache. Read only folders are skipped, the
+        bank then loads from the PNGs again
+
+        Args:
+            filename (pathlib.Path | str): Cache file
+        """
+        filename = pathlib.Path(filename)
+        with self.lock:
+            arrays = {
+                f"{'base' if matcher is self.matcher else 'scaled'}_{height}x{width}":
+                    np.packbits(matcher.images > 127, axis=-1)
+                for (height, width), matcher in self.matchers.items()
+            }
+            self.changed = False
+        temporary = None
+        try:
+            with tempfile.NamedTemporaryFile("wb", dir=filename.parent, suffix=".tmp", delete=False) as file:
+                temporary = file.name
+                np.savez(file, **arrays)
+            os.replace(temporary, filename)
+        except OSError:
+            if temporary is not None and os.path.exists(temporary):
+                os.remove(temporary)
+
+    def persist(self) -> None:
+        """Saves the cache if sizes were scaled since it was read or
+        written. Only the main process writes it, workers of
+        ParallelRecognizer leave it alone"""
+        if self.filename is None or not self.changed or multiprocessing.parent_process() is not None:
+            return
+        self.save(self.filename)
+
+    def matcher_for(self, height: int, width: int) -> TemplateMatcher:
+        """Gets the template matcher for cells of the given size. The first
+        time a size is used the templates are scaled. Call persist to keep
+        the new sizes for the next start
+
+        Args:
+            height (int): Cell height in pixels
+            width (int): Cell width in pixels
+
+        Returns:
+            TemplateMatcher: Matcher with templates of the given size
+        """
+        with self.lock:
+            matcher = self.matchers.get((height, width))
+            if matcher is not None:
+                return matcher
+            matcher = self.matcher.scaled(height, width)
+            self.matchers[(height, width)] = matcher
+            self.changed = True
+        return matcher
+
+
+def unpack_templates(bits: np.ndarray, width: int) -> np.ndarray:
+    """Reverses the packing of TemplateBank.save
+
+    Args:
+        bits (np.ndarray): Packed bits with shape (9, h, ceil(w / 8))
+        width (int): Width of the templates
+
+    Returns:
+        np.ndarray: Black digit on white templates with shape (9, h, w)
+    """
+    return np.unpackbits(bits, axis=-1, count=width) * np.uint8(BACKGROUND_GRAY)
+
+
+def ssim_digit(
+    square: np.ndarray,
+    bank: TemplateBank,
+    binarization: str = "otsu",
+    threshold: float | None = None
+) -> int:
+    """Recognizes one square by comparing it with every template using SSIM
+
+    Args:
+        square (np.ndarray): RGBA square image
+        bank (TemplateBank): Number templates
+        binarization (str, optional): Binarization strategy, see binarize.
+        Defaults to "otsu".
+        threshold (float | None, optional): Board-wide threshold, see binarize.
+        Defaults to None.
+
+    Returns:
+        int: The digit on the square, 0 if it is empty
+    """
+    ssim_list = ssim_scores(square, bank, binarization, threshold)
+    if ssim_list is None:
+        return 0
+    return ssim_list.index(max(ssim_list)) + 1
+
+
+def ssim_scores(
+    square: np.ndarray,
+    bank: TemplateBank,
+    binarization: str = "otsu",
+    threshold: float | None = None
+) -> list[float] | None:
+    """Compares one square with every template using SSIM
+
+    Args:
+        square (np.ndarray): RGBA square image
+        bank (TemplateBank): Number templates
+        binarization (str, optional): Binarization strategy, see binarize.
+        Defaults to "otsu".
+        threshold (float | None, optional): Board-wide threshold, see binarize.
+        Defaults to None.
+
+    Returns:
+        list[float] | None: SSIM of each digit from 1 to 9, None if the square is empty
+    """
+    opencv_image = cv2.cvtColor(np.asarray(square), cv2.COLOR_RGBA2RGB)
+    reshaped_image = opencv_image.reshape(-1, 3)
+
+    if (reshaped_image == reshaped_image[0]).all():
+        return None
+
+    gray_img = binarize(opencv_image, binarization, threshold)
+    templates = bank.matcher_for(*gray_img.shape).images
+    return [ssim(gray_img, template) for template in templates]
+
+
+def recognize_with(
+    bank: TemplateBank,
+    squares: list[np.ndarray],
+    recognizer: str = "ncc",
+    binarization: str = "otsu",
+    threshold: float | None = None
+) -> list[int]:
+    """Recognizes same-sized squares with the given recognizer. The
+    sequential and the parallel recognition both end up here, so they give
+    the same digits
+
+    Args:
+        bank (TemplateBank): Number templates
+        squares (list[np.ndarray]): RGBA square images
+        recognizer (str, optional): One of RECOGNIZERS. Defaults to "ncc".
+        binarization (str, optional): Binarization strategy, see binarize.
+        Defaults to "otsu".
+        threshold (float | None, optional): Board-wide threshold, see binarize.
+        Defaults to None.
+
+    Returns:
+        list[int]: The digit on each square, 0 for empty squares
+    """
+    if not squares:
+        return []
+    if recognizer == "ncc":
+        height, width = np.asarray(squares[0]).shape[:2]
+        return bank.matcher_for(height, width).recognize_cells(squares, binarization, threshold)
+    elif recognizer == "ssim":
+        return [ssim_digit(square, bank, binarization, threshold) for square in squares]
+    raise ValueError(f"Unknown recognizer: {recognizer}")
+
+
+def digit_scores(
+    bank: TemplateBank,
+    squares: list[np.ndarray],
+    recognizer: str = "ncc",
+    binarization: str = "otsu",
+    threshold: float | None = None
+) -> np.ndarray:
+    """Scores same-sized squares against every template with the given
+    recognizer. The digit recognize_with picks is the best score of a row
+
+    Args:
+        bank (TemplateBank): Number templates
+        squares (list[np.ndarray]): RGBA square images
+        recognizer (str, optional): One of RECOGNIZERS. Defaults to "ncc".
+        binarization (str, optional): Binarization strategy, see binarize.
+        Defaults to "otsu".
+        threshold (float | None, optional): Board-wide threshold, see binarize.
+        Defaults to None.
+
+    Returns:
+        np.ndarray: Scores with shape (n, 9), higher is better and column i is
+        digit i + 1. Rows of empty squares are NaN
+    """
+    if recognizer == "ncc":
+        if not squares:
+            return np.full((0, 9), np.nan, dtype=np.float32)
+        height, width = np.asarray(squares[0]).shape[:2]
+        return bank.matcher_for(height, width).cell_scores(squares, binarization, threshold)
+    elif recognizer == "ssim":
+        scores = np.full((len(squares), 9), np.nan, dtype=np.float32)
+        for i, square in enumerate(squares):
+            ssim_list = ssim_scores(square, bank, binarization, threshold)
+            if ssim_list is not None:
+                scores[i] = ssim_list
+        return scores
+    raise ValueError(f"Unknown recognizer: {recognizer}")
+
+
+def score_margins(scores: np.ndarray) -> np.ndarray:
+    """Measures how confident each recognized digit is as the margin between
+    its best and second best score
+
+    Args:
+        scores (np.ndarray): Scores with shape (n, 9), see digit_scores
+
+    Returns:
+        np.ndarray: Margin of every square, small for doubtful digits and NaN
+        for empty squares
+    """
+    ordered = np.sort(scores, axis=1)
+    return ordered[:, -1] - ordered[:, -2]
+
+
+class ParallelRecognizer:
+    """Spreads the squares of a board over a process pool. Every worker
+    loads the template bank once when it starts. The square pixels are
+    written to one shared memory block that the workers read in place, so
+    only the block name and index ranges are pickled"""
+
+    def __init__(self, workers: int | None = None, folder: pathlib.Path | str = TEMPLATE_FOLDER) -> None:
+        """
+        Args:
+            workers (int | None, optional): Number of worker processes, None
+            for one per CPU. Defaults to None.
+            folder (pathlib.Path | str, optional): Template folder, see
+            TemplateBank.load. Defaults to TEMPLATE_FOLDER.
+        """
+        self.workers: int = workers or os.cpu_count() or 1
+        self.folder: str = str(pathlib.Path(folder).resolve())
+        # Workers share the resource tracker of this process only if it runs
+        # before they start. Otherwise each worker starts its own tracker,
+        # and that tracker unlinks the blocks the worker opened when the
+        # worker exits
+        resource_tracker.ensure_running()
+        self.executor = futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_recognition_worker,
+            initargs=(self.folder,)
+        )
+
+    def recognize_cells(
+        self,
+        squares: list[np.ndarray],
+        recognizer: str = "ncc",
+        binarization: str = "otsu",
+        threshold: float | None = None
+    ) -> list[int]:
+        """Recognizes same-sized squares on the pool, see recognize_with
+
+        Args:
+            squares (list[np.ndarray]): RGBA square images
+            recognizer (str, optional): One of RECOGNIZERS. Defaults to "ncc".
+            binarization (str, optional): Binarization strategy, see binarize.
+            Defaults to "otsu".
+            threshold (float | None, optional): Board-wide threshold, see binarize.
+            Defaults to None.
+
+        Returns:
+            list[int]: The digit on each square, 0 for empty squares
+        """
+        if not squares:
+            return []
+
+        shape = (len(squares),) + np.asarray(squares[0]).shape
+        block = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        try:
+            cells = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+            for i, square in enumerate(squares):
+                cells[i] = square
+            # The block can only be closed once no array uses its buffer
+            del cells
+
+            bounds = np.linspace(0, len(squares), min(self.workers, len(squares)) + 1).astype(int).tolist()
+            jobs = [
+                self.executor.submit(
+                    _recognize_shared, block.name, shape, start, stop, recognizer, binarization, threshold, self.folder
+                )
+                for start, stop in zip(bounds, bounds[1:])
+            ]
+            return [digit for job in jobs for digit in job.result()]
+        finally:
+            block.close()
+            block.unlink()
+
+    def close(self) -> None:
+        """Stops the worker processes"""
+        self.executor.shutdown()
+
+
+def _init_recognition_worker(folder: str) -> None:
+    """Loads the template bank when a worker of ParallelRecognizer starts
+
+    Args:
+        folder (str): Template folder
+    """
+    TemplateBank.load(folder)
+
+
+def _recognize_shared(
+    name: str,
+    shape: tuple[int, ...],
+    start: int,
+    stop: int,
+    recognizer: str,
+    binarization: str,
+    threshold: float | None,
+    folder: str
+) -> list[int]:
+    """Recognizes a range of the squares in a shared memory block, used as
+    the worker function of ParallelRecognizer
+
+    Args:
+        name (str): Name of the shared memory block
+        shape (tuple[int, ...]): Shape of the squares array in the block
+        start (int): First square to recognize
+        stop (int): Square to stop before
+        recognizer (str): One of RECOGNIZERS
+        binarization (str): Binarization strategy, see binarize
+        threshold (float | None): Board-wide threshold, see binarize
+        folder (str): Template folder
+
+    Returns:
+        list[int]: The digit on each square of the range
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        squares = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)[start:stop]
+        digits = recognize_with(TemplateBank.load(folder), list(squares), recognizer, binarization, threshold)
+        del squares
+    finally:
+        block.close()
+    return digits
+
+
+class RecognitionCache:
+    """Least recently used cache from square pixels to recognized digits.
+    "exact" keys only match identical pixels, "perceptual" keys match squares
+    that look the same once shrunk to 16x16 black and white pixels"""
+
+    def __init__(self, mode: str = "exact", max_size: int = 4096, tag: str = "") -> None:
+        """
+        Args:
+            mode (str, optional): One of CACHE_MODES except "off". Defaults to "exact".
+            max_size (int, optional): Number of entries to keep. Defaults to 4096.
+            tag (str, optional): Prefix for every key, so results of different
+            recognition settings never mix. Defaults to "".
+        """
+        if mode not in CACHE_MODES[1:]:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.mode: str = mode
+        self.max_size: int = max_size
+        self.tag: str = tag
+        self.entries: OrderedDict[str, int] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def key(self, square: np.ndarray) -> str:
+        """Computes the cache key of a square image
+
+        Args:
+            square (np.ndarray): Square image
+
+        Returns:
+            str: Cache key
+        """
+        pixels = np.ascontiguousarray(square)
+        if self.mode == "perceptual":
+            gray = cv2.cvtColor(pixels[..., :3], cv2.COLOR_RGB2GRAY) if pixels.ndim == 3 else pixels
+            small = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA)
+            digest = np.packbits(small > small.mean()).tobytes().hex()
+        else:
+            digest = hashlib.blake2b(pixels.data, digest_size=16).hexdigest()
+        return f"{self.tag}{pixels.shape}:{digest}"
+
+    def get(self, key: str) -> int | None:
+        """Looks up a digit and counts the hit or miss
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            int | None: The cached digit, None if the key is not cached
+        """
+        digit = self.entries.get(key)
+        if digit is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return digit
+
+    def put(self, key: str, digit: int) -> None:
+        """Stores a digit, evicting the least recently used entry when full
+
+        Args:
+            key (str): Cache key
+            digit (int): Recognized digit
+        """
+        self.entries[key] = digit
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def load(self, filename: str) -> None:
+        """Loads entries saved by save, if the file exists
+
+        Args:
+            filename (str): Cache file
+        """
+        if pathlib.Path(filename).exists():
+            with open(filename, "r") as file:
+                for key, digit in json.load(file).items():
+                    self.put(key, digit)
+
+    def save(self, filename: str) -> None:
+        """Saves all entries to a file
+
+        Args:
+            filename (str): Cache file
+        """
+        with open(filename, "w") as file:
+            json.dump(self.entries, file)
+
+
+class IncrementalBoardReader:
+    """Reads consecutive frames of the same board, classifying only the
+    squares that changed since the previous frame and reusing the earlier
+    digits for the rest"""
+
+    def __init__(self, classify, tolerance: float = 0.0) -> None:
+        """
+        Args:
+            classify (function): Takes a list of square images and returns
+            their digits
+            tolerance (float, optional): Mean absolute pixel difference a square
+            may have and still count as unchanged. Defaults to 0.0.
+        """
+        self.classify = classify
+        self.tolerance: float = tolerance
+        self.previous: np.ndarray = None
+        self.digits: list[int] = []
+        self.last_changed: int = 0
+
+    def reset(self) -> None:
+        """Forgets the previous frame, so the next read classifies every square"""
+        self.previous = None
+        self.digits = []
+
+    def read(self, squares: list[np.ndarray]) -> list[list[int]]:
+        """Converts the 81 square images of a frame into a sudoku board
+
+        Args:
+            squares (list[np.ndarray]): Square images in row-major order
+
+        Returns:
+            list[list[int]]: Board with zeros for empty squares
+        """
+        current = np.stack([np.asarray(square) for square in squares])
+
+        if self.previous is None or self.previous.shape != current.shape:
+            changed = list(range(len(squares)))
+            self.digits = [0] * len(squares)
+        else:
+            difference = np.abs(current.astype(np.int16) - self.previous).mean(axis=tuple(range(1, current.ndim)))
+            changed = np.flatnonzero(difference > self.tolerance).tolist()
+
+        for i, digit in zip(changed, self.classify([squares[i] for i in changed])):
+            self.digits[i] = digit
+
+        self.previous = current
+        self.last_changed = len(changed)
+        return [self.digits[y * 9:y * 9 + 9] for y in range(9)]
+
+    def correct(self, board: list[list[int]]) -> None:
+        """Replaces the digits of the previous frame, for example after
+        misread squares were repaired, so the next frames reuse the corrected
+        digits
+
+        Args:
+            board (list[list[int]]): Corrected board
+        """
+        self.digits = [n for row in board for n in row]
+
+
+if __name__ == "__main__":
+    bank = TemplateBank.load()
+
+    def render(digit: int, size: int = 40, ink: int = 0, paper: int = 255) -> np.ndarray:
+        """Draws a template as an RGBA square with the given colours"""
+        template = bank.matcher_for(size, size).images[digit - 1]
+        square = np.where(template[..., None] < 128, ink, paper).astype(np.uint8)
+        return np.concatenate([np.repeat(square, 3, axis=2), np.full((size, size, 1), 255, np.uint8)], axis=2)
+
+    # Least recently used entries are evicted first, reads count as uses
+    cache = RecognitionCache("exact", max_size=3)
+    keys = [cache.key(render(digit)) for digit in range(1, 6)]
+    assert len(set(keys)) == 5
+    for digit, key in zip(range(1, 4), keys):
+        cache.put(key, digit)
+    assert cache.get(keys[0]) == 1
+    cache.put(keys[3], 4)
+    assert list(cache.entries) == [keys[2], keys[0], keys[3]]
+    assert cache.get(keys[1]) is None and (cache.hits, cache.misses) == (1, 1)
+    cache.put(keys[0], 7)
+    cache.put(keys[4], 5)
+    assert list(cache.entries) == [keys[3], keys[0], keys[4]] and cache.entries[keys[0]] == 7
+
+    # Exact keys change with any pixel, the tag and the size
+    square = render(8)
+    changed = square.copy()
+    changed[0, 0, 0] ^= 1
+    assert cache.key(square) == cache.key(square.copy()) != cache.key(changed)
+    assert RecognitionCache("exact", tag="ncc/").key(square) != cache.key(square)
+    assert cache.key(render(8, 41)) != cache.key(square)
+
+    # Perceptual keys ignore noise and colour but still tell digits apart
+    perceptual = RecognitionCache("perceptual")
+    rng = np.random.default_rng(0)
+    noisy = square.astype(np.int16)
+    noisy[..., :3] += rng.integers(-20, 21, size=noisy[..., :3].shape, dtype=np.int16)
+    noisy = noisy.clip(0, 255).astype(np.uint8)
+    assert perceptual.key(noisy) == perceptual.key(square) != perceptual.key(render(3))
+    assert perceptual.key(render(8, ink=40, paper=230)) == perceptual.key(square)
+    assert len({perceptual.key(render(digit)) for digit in range(1, 10)}) == 9
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache.save(f"{folder}/cache.json")
+        loaded = RecognitionCache("exact", max_size=3)
+        loaded.load(f"{folder}/cache.json")
+        loaded.load(f"{folder}/missing.json")
+        assert loaded.entries == cache.entries
+    try:
+        RecognitionCache("off")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Created a cache in mode off")
+    print("Recognition cache test: eviction, keys and persistence agree")
+
+    # Only squares that changed since the previous frame are classified again
+    classified: list[int] = []
+
+    def classify(squares: list[np.ndarray]) -> list[int]:
+        classified.append(len(squares))
+        return recognize_with(bank, squares)
+
+    empty_square = np.full((40, 40, 4), 255, dtype=np.uint8)
+    digits = [(i * 7) % 10 for i in range(81)]
+    frame = [render(n) if n else empty_square for n in digits]
+    reader = IncrementalBoardReader(classify)
+    assert reader.read(frame) == [digits[y * 9:y * 9 + 9] for y in range(9)]
+    assert classified == [81] and reader.last_changed == 81
+
+    assert reader.read([square.copy() for square in frame])[0] == digits[:9]
+    assert classified[-1] == 0 and reader.last_changed == 0
+
+    frame[4] = render(6)
+    board = reader.read(frame)
+    assert classified[-1] == 1 and board[0][4] == 6 and board[1] == digits[9:18]
+
+    # Small differences count as unchanged only within the tolerance
+    shifted = [square.copy() for square in frame]
+    shifted[10][..., :3] = shifted[10][..., :3] // 2 + 64
+    tolerant = IncrementalBoardReader(classify, tolerance=80.0)
+    tolerant.read(frame)
+    tolerant.read(shifted)
+    assert tolerant.last_changed == 0
+    reader.read(shifted)
+    assert reader.last_changed == 1
+
+    # Corrected digits are reused for unchanged squares, until a reset
+    corrected = reader.read(shifted)
+    corrected[0][4] = 9
+    reader.correct(corrected)
+    assert reader.read(shifted)[0][4] == 9 and reader.last_changed == 0
+    reader.reset()
+    assert reader.read(shifted)[0][4] == 6 and reader.last_changed == 81
+
+    # Frames of another size start over
+    assert reader.read([render(1, 30)] * 81)[8][8] == 1 and reader.last_changed == 81
+    print("Incremental reader test: changed squares are detected")
@@ -1,9 +1,36 @@
 import copy
+import itertools
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from sudoku_lazy import lazy_import
 
+# Only solve_many needs a process pool
+futures = lazy_import("concurrent.futures")
 
-class SudokuSolver:
-    __result: list = []
+# Lookup tables shared by the bitmask engine. Cells are indexed row-major,
+# 0..80, and digit n is stored as bit n of a mask (bits 1..9).
+ALL_DIGITS: int = 0b1111111110
+ROW_OF: tuple[int, ...] = tuple(i // 9 for i in range(81))
+COL_OF: tuple[int, ...] = tuple(i % 9 for i in range(81))
+BOX_OF: tuple[int, ...] = tuple((i // 27) * 3 + (i % 9) // 3 for i in range(81))
+UNITS: tuple[tuple[int, ...], ...] = (
+    tuple(tuple(r * 9 + c for c in range(9)) for r in range(9))
+    + tuple(tuple(r * 9 + c for r in range(9)) for c in range(9))
+    + tuple(
+        tuple((b // 3) * 27 + (b % 3) * 3 + (i // 3) * 9 + i % 3 for i in range(9))
+        for b in range(9)
+    )
+)
+DIGIT_OF_BIT: dict[int, int] = {1 << n: n for n in range(1, 10)}
+
+METHODS: tuple[str, ...] = ("bitmask", "backtrack")
+# Search counters filled in by solve: cells the search branched on or
+# recursed into, branches that failed, and cells filled by propagation
+STAT_NAMES: tuple[str, ...] = ("nodes", "backtracks", "propagations")
 
+
+class SudokuSolver:
     @staticmethod
     def __isPossible(grid: list[list], y: int, x: int, n: int) -> bool:
         """Checks whether the given number is suitable for the given
@@ -39,44 +66,435 @@ class SudokuSolver:
         return True
 
     @staticmethod
-    def __solve(grid: list[list]) -> None:
+    def __solve(grid: list[list], result: list[list[list]], limit: int, counters: list[int]) -> bool:
         """Solves sudoku recursively by treating zeros as empty cells
-        and saves all results into __result variable
+        and appends every solution to result
 
         Args:
             grid (list[list]): Sudoku board to solve
+            result (list[list[list]]): Solutions found so far
+            limit (int): Number of solutions to stop at, 0 for no limit
+            counters (list[int]): Search counters in STAT_NAMES order
+
+        Returns:
+            bool: True if the limit has been reached
         """
+        counters[0] += 1
         for y in range(9):
             for x in range(9):
                 if grid[y][x] == 0:
                     for n in range(1, 10):
                         if SudokuSolver.__isPossible(grid, y, x, n):
                             grid[y][x] = n
-                            SudokuSolver.__solve(grid)
+                            done = SudokuSolver.__solve(grid, result, limit, counters)
                             grid[y][x] = 0
-                    return
-        SudokuSolver.__result.append(copy.deepcopy(grid))
+                            if done:
+                                return True
+                            counters[1] += 1
+                    return False
+        result.append(copy.deepcopy(grid))
+        return len(result) == limit
 
     @staticmethod
-    def solve(grid: list[list]) -> list[list[list]]:
-        """Finds all possible solutions to tthe given sudoku board
-        by treating zeros as empty cells. Also controls the state
-        of the __results variable
+    def __place(cells: list[int], masks: list[int], i: int, n: int) -> None:
+        """Writes a digit into a flat grid and marks it as used in the
+        row, column and box masks
+
+        Args:
+            cells (list[int]): Flat, row-major sudoku grid
+            masks (list[int]): 27 used-digit masks, rows then columns then boxes
+            i (int): Index of the cell
+            n (int): Digit to place
+        """
+        bit = 1 << n
+        cells[i] = n
+        masks[ROW_OF[i]] |= bit
+        masks[9 + COL_OF[i]] |= bit
+        masks[18 + BOX_OF[i]] |= bit
+
+    @staticmethod
+    def __propagate(cells: list[int], masks: list[int], counters: list[int]) -> tuple[int, int] | None:
+        """Fills naked and hidden singles until nothing changes, then picks
+        the empty cell with the fewest candidates
+
+        Args:
+            cells (list[int]): Flat, row-major sudoku grid
+            masks (list[int]): 27 used-digit masks, rows then columns then boxes
+            counters (list[int]): Search counters in STAT_NAMES order
+
+        Returns:
+            tuple[int, int] | None: (-1, 0) if the grid is solved, the index and
+            candidate mask of the most constrained cell if it is not, None if
+            the grid has a contradiction
+        """
+        while True:
+            changed = False
+            best, best_mask, best_count = -1, 0, 10
+            candidates = [0] * 81
+
+            # Naked singles: cells with exactly one candidate left
+            for i in range(81):
+                if cells[i]:
+                    continue
+                mask = ALL_DIGITS & ~(masks[ROW_OF[i]] | masks[9 + COL_OF[i]] | masks[18 + BOX_OF[i]])
+                if mask == 0:
+                    return None
+                if mask & (mask - 1) == 0:
+                    SudokuSolver.__place(cells, masks, i, DIGIT_OF_BIT[mask])
+                    counters[2] += 1
+                    changed = True
+                    continue
+                candidates[i] = mask
+                count = bin(mask).count("1")
+                if count < best_count:
+                    best, best_mask, best_count = i, mask, count
+
+            if changed:
+                continue
+
+            # Hidden singles: digits with exactly one possible cell in a unit
+            for u, unit in enumerate(UNITS):
+                seen_once, seen_twice = 0, 0
+                for i in unit:
+                    seen_twice |= seen_once & candidates[i]
+                    seen_once |= candidates[i]
+                if (seen_once | masks[u]) != ALL_DIGITS:
+                    return None
+                single = seen_once & ~seen_twice
+                while single:
+                    bit = single & -single
+                    single ^= bit
+                    for i in unit:
+                        if candidates[i] & bit:
+                            n = DIGIT_OF_BIT[bit]
+                            if cells[i] == n:
+                                # Same single already found through another unit
+                                break
+                            used = masks[ROW_OF[i]] | masks[9 + COL_OF[i]] | masks[18 + BOX_OF[i]]
+                            if cells[i] or used & bit:
+                                # An earlier single in this pass took the only spot
+                                return None
+                            SudokuSolver.__place(cells, masks, i, n)
+                            counters[2] += 1
+                            changed = True
+                            break
+
+            if not changed:
+                return (best, best_mask)
+
+    @staticmethod
+    def __solve_bitmask(
+        cells: list[int],
+        masks: list[int],
+        result: list[list[int]],
+        limit: int,
+        counters: list[int]
+    ) -> bool:
+        """Solves sudoku with constraint propagation and minimum remaining
+        values branching, and appends every solution to result
+
+        Args:
+            cells (list[int]): Flat, row-major sudoku grid
+            masks (list[int]): 27 used-digit masks, rows then columns then boxes
+            result (list[list[int]]): Flat solutions found so far
+            limit (int): Number of solutions to stop at, 0 for no limit
+            counters (list[int]): Search counters in STAT_NAMES order
+
+        Returns:
+            bool: True if the limit has been reached
+        """
+        counters[0] += 1
+        choice = SudokuSolver.__propagate(cells, masks, counters)
+        if choice is None:
+            return False
+
+        i, mask = choice
+        if i == -1:
+            result.append(cells)
+            return len(result) == limit
+
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            branch_cells = cells.copy()
+            branch_masks = masks.copy()
+            SudokuSolver.__place(branch_cells, branch_masks, i, DIGIT_OF_BIT[bit])
+            if SudokuSolver.__solve_bitmask(branch_cells, branch_masks, result, limit, counters):
+                return True
+            counters[1] += 1
+        return False
+
+    @staticmethod
+    def __load(grid: list[list]) -> tuple[list[int], list[int]] | None:
+        """Converts a nested grid into a flat grid and its used-digit masks
+
+        Args:
+            grid (list[list]): Sudoku board
+
+        Returns:
+            tuple[list[int], list[int]] | None: Flat grid and masks, None if
+            two givens conflict
+        """
+        cells = [0] * 81
+        masks = [0] * 27
+        for i in range(81):
+            n = grid[ROW_OF[i]][COL_OF[i]]
+            if n == 0:
+                continue
+            bit = 1 << n
+            if (masks[ROW_OF[i]] | masks[9 + COL_OF[i]] | masks[18 + BOX_OF[i]]) & bit:
+                # Conflicting givens can never be completed
+                return None
+            SudokuSolver.__place(cells, masks, i, n)
+        return cells, masks
+
+    @staticmethod
+    def __bitmask(grid: list[list], limit: int, counters: list[int]) -> list[list[int]]:
+        """Runs the bitmask engine on a nested grid
+
+        Args:
+            grid (list[list]): Sudoku board to solve
+            limit (int): Number of solutions to stop at, 0 for no limit
+            counters (list[int]): Search counters in STAT_NAMES order
+
+        Returns:
+            list[list[int]]: Flat solutions, sorted in the order the
+            backtracking engine finds them
+        """
+        loaded = SudokuSolver.__load(grid)
+        if loaded is None:
+            return []
+        cells, masks = loaded
+
+        result: list[list[int]] = []
+        SudokuSolver.__solve_bitmask(cells, masks, result, limit, counters)
+
+        # The backtracker enumerates solutions in lexicographic row-major order
+        result.sort()
+        return result
+
+    @staticmethod
+    def solve(
+        grid: list[list],
+        method: str = "bitmask",
+        max_solutions: int = 0,
+        stats: dict[str, int] | None = None
+    ) -> list[list[list]]:
+        """Finds all possible solutions to the given sudoku board
+        by treating zeros as empty cells. All search state is local
+        to the call, so it is safe to solve from several threads at once
+        and the given grid is never modified
 
         Args:
             grid (list[list]): Sudoku board to solve
+            method (str, optional): Solving engine, either "bitmask" for
+            constraint propagation or "backtrack" for the plain recursive
+            search. Defaults to "bitmask".
+            max_solutions (int, optional): Stop searching once this many
+            solutions are found, 0 for no limit. Which solutions are returned
+            under a limit depends on the engine. Defaults to 0.
+            stats (dict[str, int] | None, optional): If given, the search
+            counters named in STAT_NAMES are added to it. Defaults to None.
 
         Returns:
             list[list[list]]: All possible solutions to the given sudoku board
         """
-        SudokuSolver.__result = []
-        SudokuSolver.__solve(grid.copy())
+        if max_solutions < 0:
+            raise ValueError("max_solutions must not be negative")
+
+        counters = [0] * len(STAT_NAMES)
+        if method == "bitmask":
+            flat_result = SudokuSolver.__bitmask(grid, max_solutions, counters)
+            result = [[flat[r * 9:r * 9 + 9] for r in range(9)] for flat in flat_result]
+        elif method == "backtrack":
+            result: list[list[list]] = []
+            SudokuSolver.__solve([list(row) for row in grid], result, max_solutions, counters)
+        else:
+            raise ValueError(f"Unknown solving method: {method}")
+
+        if stats is not None:
+            for name, value in zip(STAT_NAMES, counters):
+                stats[name] = stats.get(name, 0) + value
+        return result
+
+    @staticmethod
+    def propagate(grid: list[list], stats: dict[str, int] | None = None) -> list[list[int]] | None:
+        """Fills every square that naked and hidden singles force, without
+        searching. Also works on a board whose givens are only partly known:
+        every solution of the full board is a solution of the partial one, so
+        the squares filled here hold the same digit in every solution of the
+        full board. Givens only ever get added, so the result of one call can
+        be passed to the next one together with the new givens
+
+        Args:
+            grid (list[list]): Sudoku board, zeros for empty or unknown squares
+            stats (dict[str, int] | None, optional): If given, the search
+            counters named in STAT_NAMES are added to it. Defaults to None.
+
+        Returns:
+            list[list[int]] | None: New board with the forced squares filled
+            in, None if the board has a contradiction
+        """
+        counters = [0] * len(STAT_NAMES)
+        loaded = SudokuSolver.__load(grid)
+        result = None
+        if loaded is not None:
+            cells, masks = loaded
+            if SudokuSolver.__propagate(cells, masks, counters) is not None:
+                result = [cells[r * 9:r * 9 + 9] for r in range(9)]
+
+        if stats is not None:
+            for name, value in zip(STAT_NAMES, counters):
+                stats[name] = stats.get(name, 0) + value
+        return result
+
+    @staticmethod
+    def find_conflicts(grid: list[list]) -> list[tuple[int, int]]:
+        """Finds the givens that share their digit with another given in
+        the same row, column or box. A board with conflicts has no solution,
+        and one of the conflicting givens is usually a misread square
+
+        Args:
+            grid (list[list]): Sudoku board to check
+
+        Returns:
+            list[tuple[int, int]]: (x, y) of every conflicting given in row-major order
+        """
+        conflicts: set[int] = set()
+        for unit in UNITS:
+            seen: dict[int, int] = {}
+            for i in unit:
+                n = grid[ROW_OF[i]][COL_OF[i]]
+                if n == 0:
+                    continue
+                if n in seen:
+                    conflicts.update((i, seen[n]))
+                else:
+                    seen[n] = i
+        return [(COL_OF[i], ROW_OF[i]) for i in sorted(conflicts)]
 
-        return copy.deepcopy(SudokuSolver.__result)
+    @staticmethod
+    def count_solutions(grid: list[list], limit: int = 2) -> int:
+        """Counts the solutions to the given sudoku board, stopping as
+        soon as the limit is reached
+
+        Args:
+            grid (list[list]): Sudoku board to check
+            limit (int, optional): Number of solutions to stop at, 0 for
+            no limit. Defaults to 2.
+
+        Returns:
+            int: Number of solutions, at most limit
+        """
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+        return len(SudokuSolver.__bitmask(grid, limit, [0] * len(STAT_NAMES)))
+
+    @staticmethod
+    def is_unique(grid: list[list]) -> bool:
+        """Checks whether the given sudoku board has exactly one solution
+
+        Args:
+            grid (list[list]): Sudoku board to check
+
+        Returns:
+            bool: True if the board has exactly one solution, False otherwise
+        """
+        return SudokuSolver.count_solutions(grid, 2) == 1
+
+    @staticmethod
+    def solve_many(
+        boards: Iterable[list[list]],
+        workers: int | None = None,
+        chunk_size: int = 64,
+        ordered: bool = True,
+        method: str = "bitmask",
+        max_solutions: int = 0
+    ) -> Iterator:
+        """Solves many boards on a process pool. Boards are read lazily from
+        the iterable in chunks and only a few chunks per worker are in flight
+        at a time, so the input can be a stream that does not fit in memory
+
+        Args:
+            boards (Iterable[list[list]]): Sudoku boards to solve
+            workers (int | None, optional): Number of worker processes, None
+            for one per CPU. With 1 the boards are solved in this process.
+            Defaults to None.
+            chunk_size (int, optional): Number of boards sent to a worker at
+            once. Defaults to 64.
+            ordered (bool, optional): Yield results in input order if True,
+            as soon as their chunk finishes otherwise. Defaults to True.
+            method (str, optional): Solving engine, see solve. Defaults to "bitmask".
+            max_solutions (int, optional): Solution limit per board, see solve.
+            Defaults to 0.
+
+        Yields:
+            list[list[list]] | tuple[int, list[list[list]]]: The solutions of
+            each board when ordered, (input index, solutions) pairs otherwise
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        iterator = iter(boards)
+        chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+
+        if workers <= 1:
+            index = 0
+            for chunk in chunks:
+                for solutions in _solve_chunk(chunk, method, max_solutions):
+                    yield solutions if ordered else (index, solutions)
+                    index += 1
+            return
+
+        max_in_flight = workers * 2
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: deque[tuple[int, futures.Future]] = deque()
+            index = 0
+
+            def submit_next() -> bool:
+                nonlocal index
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return False
+                pending.append((index, executor.submit(_solve_chunk, chunk, method, max_solutions)))
+                index += len(chunk)
+                return True
+
+            while len(pending) < max_in_flight and submit_next():
+                pass
+
+            while pending:
+                if ordered:
+                    start, future = pending.popleft()
+                else:
+                    done, _ = futures.wait([future for _, future in pending], return_when=futures.FIRST_COMPLETED)
+                    start, future = next(item for item in pending if item[1] in done)
+                    pending.remove((start, future))
+
+                submit_next()
+                for offset, solutions in enumerate(future.result()):
+                    yield solutions if ordered else (start + offset, solutions)
+
+
+def _solve_chunk(chunk: list[list[list]], method: str, max_solutions: int) -> list[list[list[list]]]:
+    """Solves a chunk of boards, used as the worker function of solve_many
+
+    Args:
+        chunk (list[list[list]]): Sudoku boards to solve
+        method (str): Solving engine, see SudokuSolver.solve
+        max_solutions (int): Solution limit per board, see SudokuSolver.solve
+
+    Returns:
+        list[list[list[list]]]: The solutions of each board
+    """
+    return [SudokuSolver.solve(grid, method, max_solutions) for grid in chunk]
 
 
 if __name__ == "__main__":
     """Sudoku solver tests"""
+    import time
 
     grid1 = [
         [0, 0, 0,     2, 6, 0,     7, 0, 1],
@@ -92,6 +510,20 @@ if __name__ == "__main__":
         [7, 0, 3,     0, 1, 8,     0, 0, 0],
     ]
 
+    def stress_test(cases: list[tuple[list[list], list[list[list]]]], jobs: int = 200, workers: int = 16) -> None:
+        """Solves different boards from many threads at once and checks
+        that every call got its own, correct result"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def job(i: int) -> tuple[int, list[list[list]]]:
+            grid = cases[i % len(cases)][0]
+            return i, SudokuSolver.solve(grid, METHODS[i % len(METHODS)])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, result in executor.map(job, range(jobs)):
+                assert result == cases[i % len(cases)][1], f"Job {i} got a wrong result"
+        print(f"Stress test: {jobs} concurrent solves on {workers} threads agree")
+
     def print_board(board):
         for i, line in enumerate(board):
             for j, n in enumerate(line):
@@ -105,6 +537,51 @@ if __name__ == "__main__":
     results = SudokuSolver.solve(grid1)
     output_char_len = 40
 
+    # Both engines must agree on the same input
+    for method in METHODS:
+        start_time = time.perf_counter()
+        method_results = SudokuSolver.solve(grid1, method)
+        print(f"{method}: {len(method_results)} solution(s) in {time.perf_counter() - start_time:.4f} seconds")
+        assert method_results == results
+
+    empty_grid = [[0] * 9 for _ in range(9)]
+    assert SudokuSolver.count_solutions(empty_grid, 5) == 5
+    assert len(SudokuSolver.solve(empty_grid, max_solutions=3)) == 3
+    assert len(SudokuSolver.solve(empty_grid, "backtrack", max_solutions=3)) == 3
+    assert SudokuSolver.is_unique(grid1) == (len(results) == 1)
+
+    # Squares forced by part of the givens agree with every solution
+    partial = [[n if (y + x) % 2 else 0 for x, n in enumerate(line)] for y, line in enumerate(grid1)]
+    forced = SudokuSolver.propagate(partial)
+    assert all(
+        n in (0, solution[y][x]) for solution in results for y, line in enumerate(forced) for x, n in enumerate(line)
+    )
+    assert SudokuSolver.propagate([[5] * 9] + [[0] * 9] * 8) is None
+    assert SudokuSolver.find_conflicts(grid1) == []
+    assert SudokuSolver.find_conflicts([[5, 0, 5] + [0] * 6] + [[0] * 8 + [5]] + [[0] * 9] * 7) == [(0, 0), (2, 0)]
+
+    # Solved boards with one or three cells cleared give distinct expected results
+    stress_cases = [(grid1, results)]
+    for solution in results:
+        for cleared in ((0,), (0, 40, 80)):
+            grid = copy.deepcopy(solution)
+            for i in cleared:
+                grid[i // 9][i % 9] = 0
+            stress_cases.append((grid, [solution]))
+
+    grid1_copy = copy.deepcopy(grid1)
+    stress_test(stress_cases)
+    assert grid1 == grid1_copy
+
+    # Batch solving keeps input order, or reports indexes when unordered
+    batch = [grid for grid, _ in stress_cases] * 20
+    expected = [solutions for _, solutions in stress_cases] * 20
+    assert list(SudokuSolver.solve_many(batch, workers=1)) == expected
+    assert list(SudokuSolver.solve_many(iter(batch), workers=2, chunk_size=7)) == expected
+    unordered = dict(SudokuSolver.solve_many(iter(batch), workers=2, chunk_size=7, ordered=False))
+    assert [unordered[i] for i in range(len(batch))] == expected
+    print(f"Batch test: {len(batch)} boards solved on a process pool")
+
     print(" ORIGINAL BOARD ".center(output_char_len, '-'))
     print_board(grid1)  # For pretty printing
     print("-" * output_char_len)